@@ -0,0 +1,106 @@
+"""
+Face detection latency and bbox agreement: full resolution vs downscaled cascade.
+
+    python benchmarks/bench_detection.py --images path/to/face_photos --max-side 480 640 960
+
+Each input photo is fitted (aspect preserved) into the common phone resolutions and detected with
+Detection.get_bbox() at full resolution (detect_max_side=0) and with every
+--max-side value. IoU is measured against the full-resolution bbox. Without
+--images, synthetic frames are used: latency is still meaningful but they
+contain no face, so IoU is not reported.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+from common import PHONE_RESOLUTIONS, print_table, synthetic_image, time_call, write_json
+
+from src.detection import Detection
+
+
+def iou(a, b) -> float:
+    ax0, ay0, aw, ah = a
+    bx0, by0, bw, bh = b
+    ix = max(0, min(ax0 + aw, bx0 + bw) - max(ax0, bx0))
+    iy = max(0, min(ay0 + ah, by0 + bh) - max(ay0, by0))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _safe_bbox(detector: Detection, img: np.ndarray):
+    try:
+        return detector.get_bbox(img)
+    except RuntimeError:
+        return None
+
+
+def fit_to(src: np.ndarray, w: int, h: int) -> np.ndarray:
+    """
+    Resize keeping aspect ratio and center on a w x h canvas (faces are not stretched).
+    """
+    scale = min(w / src.shape[1], h / src.shape[0])
+    resized = cv2.resize(src, (round(src.shape[1] * scale), round(src.shape[0] * scale)), interpolation=cv2.INTER_CUBIC)
+    canvas = np.full((h, w, 3), 128, dtype=np.uint8)
+    y0, x0 = (h - resized.shape[0]) // 2, (w - resized.shape[1]) // 2
+    canvas[y0 : y0 + resized.shape[0], x0 : x0 + resized.shape[1]] = resized
+    return canvas
+
+
+def load_images(images_dir: str | None) -> list[np.ndarray]:
+    if images_dir:
+        imgs = [cv2.imread(os.path.join(images_dir, n), cv2.IMREAD_COLOR) for n in sorted(os.listdir(images_dir))]
+        imgs = [im for im in imgs if im is not None]
+        if imgs:
+            return imgs
+    return [synthetic_image(640, 480, seed) for seed in range(3)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="folder of photos containing one face each")
+    parser.add_argument("--max-side", type=int, nargs="+", default=[480, 640, 960])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    sources = load_images(args.images)
+    has_faces = bool(args.images)
+    detector = Detection()
+
+    rows = []
+    for res_name, (w, h) in PHONE_RESOLUTIONS.items():
+        frames = [fit_to(src, w, h) for src in sources]
+        detector.detect_max_side = 0
+        full_boxes = [_safe_bbox(detector, f) for f in frames]
+        full = time_call(lambda: [_safe_bbox(detector, f) for f in frames], repeat=args.repeat, warmup=1)
+        rows.append({"resolution": res_name, "max_side": "full", "ms_per_image": full["p50_ms"] / len(frames)})
+
+        for max_side in args.max_side:
+            detector.detect_max_side = max_side
+            boxes = [_safe_bbox(detector, f) for f in frames]
+            stats = time_call(lambda: [_safe_bbox(detector, f) for f in frames], repeat=args.repeat, warmup=1)
+            row = {
+                "resolution": res_name,
+                "max_side": max_side,
+                "ms_per_image": stats["p50_ms"] / len(frames),
+                "speedup": full["p50_ms"] / stats["p50_ms"] if stats["p50_ms"] else None,
+            }
+            if has_faces:
+                pairs = [(a, b) for a, b in zip(full_boxes, boxes) if a is not None]
+                row["mean_iou"] = float(np.mean([iou(a, b) if b is not None else 0.0 for a, b in pairs])) if pairs else None
+                row["found"] = f"{sum(b is not None for b in boxes)}/{sum(a is not None for a in full_boxes)}"
+            rows.append(row)
+
+    print_table(rows, ["resolution", "max_side", "ms_per_image", "speedup", "mean_iou", "found"])
+    if args.json:
+        write_json(args.json, {"images": len(sources), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Per-stage micro-benchmarks with JSON baselines and a regression gate.
+
+    python benchmarks/bench_stages.py run --out benchmarks/baselines/stages.json
+    python benchmarks/bench_stages.py run --out /tmp/current.json --compare benchmarks/baselines/stages.json
+    python benchmarks/bench_stages.py compare benchmarks/baselines/stages.json /tmp/current.json --threshold 0.15
+
+Stages (synthetic frames at the common phone resolutions, fully offline):
+- decode_base64_image, _decode_image_bytes (the single-pass decoder that replaced _preprocess_image)
+- Detection.get_bbox (with the service's DETECT_MAX_SIDE), CropImage.crop / crop_batch, data_io to_tensor
+- AntiSpoofPredict input preparation (reusable input buffer), predict and predict_batch at several batch sizes
+- end-to-end handlers through an in-process TestClient: /v1/verify-liveness, /v1/verify-liveness/raw,
+  /api/predict, /v1/batch-verify
+
+Startup cost (import, load, optimize/warmup, canary) is recorded in meta.startup_s; see bench_startup.py
+for import and time-to-ready of eager vs lazy startup.
+
+main.py is imported with the service's environment (MODEL_*, INFERENCE_BACKEND, ...), except that the
+result cache is disabled so repeated requests are really processed. compare exits with status 1 when a
+stage's p50 is slower than the baseline by more than --threshold (relative) and --min-delta-ms; only compare runs made on
+the same machine and settings.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import platform
+import sys
+import time
+
+from common import PHONE_RESOLUTIONS, print_table, synthetic_image, synthetic_jpeg, time_call, write_json
+
+BATCH_SIZES = (1, 4, 16, 32)
+E2E_RESOLUTION = "720p"
+
+
+def _load_service():
+    os.environ["RESULT_CACHE_SIZE"] = "0"
+    import main
+
+    return main
+
+
+def _crop_spec(main):
+    models = main.registry.active
+    scale, h_input, w_input = models.ensemble.specs[models.names[0]]
+    return (scale if scale is not None else 1.0), h_input, w_input
+
+
+def bench_stages(main, client, resolutions, repeat: int) -> dict:
+    """
+    client: TestClient for main.app, already started (the lifespan optimizes and warms the models).
+    """
+    from src.data_io.functional import to_tensor
+    from src.utility import center_square_bbox
+
+    results = {}
+    scale, h_input, w_input = _crop_spec(main)
+
+    for res in resolutions:
+        w, h = PHONE_RESOLUTIONS[res]
+        jpeg = synthetic_jpeg(w, h)
+        b64 = base64.b64encode(jpeg).decode()
+        image = synthetic_image(w, h)
+        bbox = center_square_bbox(image)
+        bbox = [bbox[0] + bbox[2] // 4, bbox[1] + bbox[3] // 4, bbox[2] // 2, bbox[3] // 2]
+
+        results[f"decode_base64_image[{res}]"] = time_call(lambda: main.decode_base64_image(b64), repeat)
+        results[f"decode_image_bytes[{res}]"] = time_call(lambda: main._decode_image_bytes(jpeg), repeat)
+        results[f"get_bbox[{res}]"] = time_call(lambda: main._detect_bbox(image), repeat)
+        results[f"crop[{res}]"] = time_call(
+            lambda: main.image_cropper.crop(org_img=image, bbox=bbox, scale=scale, out_w=w_input, out_h=h_input), repeat
+        )
+        faces = [([bbox[0] + dx, bbox[1] + dy, bbox[2], bbox[3]], scale, (w_input, h_input)) for dx in (-8, 0, 8) for dy in (-8, 8)]
+        results[f"crop_batch[{res}x{len(faces)}]"] = time_call(lambda: main.image_cropper.crop_batch(image, faces), repeat)
+
+    crop = synthetic_image(w_input, h_input)
+    results["to_tensor[crop]"] = time_call(lambda: to_tensor(crop), repeat * 5)
+    predictor = main.registry.active.predictor
+    results["predict[1]"] = time_call(lambda: predictor.predict(crop), repeat)
+    for bs in BATCH_SIZES:
+        crops = [synthetic_image(w_input, h_input, seed) for seed in range(bs)]
+        results[f"preprocess_batch[{bs}]"] = time_call(lambda: predictor._to_input(crops), repeat * 5)
+        results[f"predict_batch[{bs}]"] = time_call(lambda: predictor.predict_batch(crops), repeat)
+
+    w, h = PHONE_RESOLUTIONS[E2E_RESOLUTION]
+    jpeg = synthetic_jpeg(w, h)
+    b64 = base64.b64encode(jpeg).decode()
+    frames = [{"image_base64": base64.b64encode(synthetic_jpeg(w, h, seed)).decode()} for seed in range(8)]
+
+    def post(*args, **kwargs):
+        r = client.post(*args, **kwargs)
+        if r.status_code != 200:
+            raise RuntimeError(f"{args[0]} returned {r.status_code}: {r.text[:200]}")
+
+    results[f"e2e_verify_liveness[{E2E_RESOLUTION}]"] = time_call(
+        lambda: post("/v1/verify-liveness", json={"image_base64": b64}), repeat
+    )
+    results[f"e2e_verify_liveness_raw[{E2E_RESOLUTION}]"] = time_call(
+        lambda: post("/v1/verify-liveness/raw", content=jpeg, headers={"content-type": "image/jpeg"}), repeat
+    )
+    results[f"e2e_api_predict[{E2E_RESOLUTION}]"] = time_call(
+        lambda: post("/api/predict", files={"file": ("frame.jpg", jpeg, "image/jpeg")}), repeat
+    )
+    results[f"e2e_batch_verify[8x{E2E_RESOLUTION}]"] = time_call(lambda: post("/v1/batch-verify", json=frames), max(3, repeat // 2))
+    return results
+
+
+def _meta(main, repeat: int) -> dict:
+    import cv2
+    import torch
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "opencv": cv2.__version__,
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "backend": main.INFERENCE_BACKEND,
+        "models": main.registry.active.names,
+        "model_version": main.registry.active.version,
+        "repeat": repeat,
+        "startup_mode": main.STARTUP_MODE,
+        "startup_s": main.startup["timings_s"],
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float, metric: str = "p50_ms", min_delta_ms: float = 0.05):
+    """
+    Rows per stage and whether any stage regressed: slower by more than `threshold` (relative)
+    and by more than `min_delta_ms` (absolute, keeps sub-0.1 ms stages from flagging on noise).
+    """
+    rows = []
+    regressed = False
+    base_results, cur_results = baseline["results"], current["results"]
+    for name in sorted(set(base_results) | set(cur_results)):
+        b, c = base_results.get(name), cur_results.get(name)
+        if b is None or c is None:
+            rows.append({"stage": name, "status": "new" if b is None else "missing"})
+            continue
+        ratio = c[metric] / b[metric] if b[metric] > 0 else float("inf")
+        slower = ratio > 1.0 + threshold and c[metric] - b[metric] > min_delta_ms
+        status = "REGRESSION" if slower else ("faster" if ratio < 1.0 - threshold else "ok")
+        regressed |= status == "REGRESSION"
+        rows.append({"stage": name, "baseline_ms": b[metric], "current_ms": c[metric], "change": f"{(ratio - 1.0) * 100:+.1f}%", "status": status})
+    return rows, regressed
+
+
+def _print_compare(rows):
+    print_table(rows, ["stage", "baseline_ms", "current_ms", "change", "status"])
+
+
+def cmd_run(args) -> int:
+    from fastapi.testclient import TestClient
+
+    main = _load_service()
+    with TestClient(main.app) as client:
+        while main.startup["state"] == "starting":  # STARTUP_MODE=lazy loads in the background
+            time.sleep(0.05)
+        if main.startup["state"] != "ready":
+            raise RuntimeError(f"Service failed to start: {main.startup['error']}")
+        results = bench_stages(main, client, args.resolutions, args.repeat)
+    report = {"meta": _meta(main, args.repeat), "results": results}
+
+    print_table([{"stage": k, **v} for k, v in results.items()], ["stage", "p50_ms", "p95_ms", "mean_ms", "min_ms", "n"])
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        write_json(args.out, report)
+        print(f"Saved: {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            rows, regressed = compare(json.load(f), report, args.threshold, min_delta_ms=args.min_delta_ms)
+        print()
+        _print_compare(rows)
+        return 1 if regressed else 0
+    return 0
+
+
+def cmd_compare(args) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows, regressed = compare(baseline, current, args.threshold, args.metric, args.min_delta_ms)
+    _print_compare(rows)
+    if regressed:
+        print(f"\nRegression: at least one stage is more than {args.threshold * 100:.0f}% slower than the baseline.")
+    return 1 if regressed else 0
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="benchmark every stage")
+    run.add_argument("--out", help="write results to this JSON file (e.g. benchmarks/baselines/stages.json)")
+    run.add_argument("--resolutions", nargs="+", choices=list(PHONE_RESOLUTIONS), default=list(PHONE_RESOLUTIONS))
+    run.add_argument("--repeat", type=int, default=20)
+    run.add_argument("--compare", help="baseline JSON to compare against after the run")
+    run.add_argument("--threshold", type=float, default=0.15, help="allowed relative slowdown (0.15 = 15%%)")
+    run.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    run.set_defaults(func=cmd_run)
+
+    cmp_ = sub.add_parser("compare", help="compare two result files")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("current")
+    cmp_.add_argument("--threshold", type=float, default=0.15, help="allowed relative slowdown (0.15 = 15%%)")
+    cmp_.add_argument("--metric", choices=["p50_ms", "p95_ms", "mean_ms", "min_ms"], default="p50_ms")
+    cmp_.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    cmp_.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
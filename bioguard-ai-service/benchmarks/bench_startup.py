@@ -0,0 +1,100 @@
+"""
+Import and startup time of the service, eager vs lazy (STARTUP_MODE).
+
+    python benchmarks/bench_startup.py --repeat 3 --json /tmp/startup.json
+
+Per mode, measured in fresh processes:
+- import_s: `import main` alone (lazy mode keeps torch and the models out of it)
+- health_s: process spawn until GET /health answers 200 (uvicorn, one worker)
+- ready_s: process spawn until GET /ready answers 200 (models loaded, optimized, warmed up, canary passed)
+- server timings_s from /ready: load, prepare, canary, ready_after (seconds from main.py's config to ready)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from common import SERVICE_DIR, print_table, wait_until_ok, write_json
+
+MODES = ("eager", "lazy")
+
+_IMPORT_SNIPPET = (
+    "import sys, time; t0 = time.perf_counter(); import main; "
+    "print(time.perf_counter() - t0, 'torch' in sys.modules)"
+)
+
+
+def measure_import(mode: str) -> tuple[float, bool]:
+    """
+    (seconds to import main, whether torch got imported) in a fresh interpreter.
+    """
+    out = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SNIPPET],
+        cwd=SERVICE_DIR,
+        env=dict(os.environ, STARTUP_MODE=mode),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    return float(out[-2]), out[-1] == "True"
+
+
+def measure_server(mode: str, port: int, timeout_s: float) -> dict:
+    base_url = f"http://127.0.0.1:{port}"
+    t0 = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=SERVICE_DIR,
+        env=dict(os.environ, STARTUP_MODE=mode),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ok(base_url + "/health", timeout_s, interval_s=0.02)
+        health_s = time.monotonic() - t0
+        wait_until_ok(base_url + "/ready", timeout_s, interval_s=0.02)
+        ready_s = time.monotonic() - t0
+        with urllib.request.urlopen(base_url + "/ready", timeout=5) as resp:
+            server = json.load(resp)["startup"]["timings_s"]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return {"health_s": health_s, "ready_s": ready_s, **{f"server_{k}_s": v for k, v in server.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    rows = []
+    for mode in args.modes:
+        runs = []
+        for _ in range(args.repeat):
+            import_s, torch_imported = measure_import(mode)
+            runs.append({"import_s": import_s, **measure_server(mode, args.port, args.timeout)})
+        row = {"mode": mode, "torch_at_import": torch_imported}
+        for key in runs[0]:
+            row[key] = statistics.median(r[key] for r in runs)
+        rows.append(row)
+
+    columns = ["mode", "torch_at_import", "import_s", "health_s", "ready_s"]
+    columns += [k for k in rows[0] if k.startswith("server_")]
+    print_table(rows, columns)
+    if args.json:
+        write_json(args.json, {"repeat": args.repeat, "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Thread / worker sweep: throughput vs tail latency of the CPU threading policy on this host.
+
+    python benchmarks/bench_threads.py --duration 10 --json /tmp/threads.json
+    python benchmarks/bench_threads.py --workers 1 2 4 --threads auto 1 2 --inference-workers 1 2 4 --affinity 0 1
+
+Every combination of gunicorn workers (WEB_CONCURRENCY), torch/OpenCV threads per worker
+(TORCH_NUM_THREADS = CV2_NUM_THREADS = ORT_NUM_THREADS; "auto" leaves them to
+src/threading_policy.py), concurrent requests per worker (INFERENCE_WORKERS) and pinning
+(CPU_AFFINITY) is started fresh and driven by the same closed-loop client load (--clients
+connections against /v1/verify-liveness, result cache off). The table reports req/s and
+latency percentiles; rows marked "*" are the frontier: no other configuration has both
+higher throughput and lower p99.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import itertools
+import json
+import os
+import subprocess
+import sys
+import urllib.request
+
+from common import SERVICE_DIR, closed_loop_load, print_table, synthetic_jpeg, wait_until_ok, write_json
+from src.threading_policy import ThreadPolicy
+
+
+def _default_workers(cpus: int) -> list[int]:
+    return sorted({1, max(1, cpus // 2), cpus})
+
+
+def run_config(config: dict, args, body: bytes) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(config["workers"]),
+        INFERENCE_WORKERS=str(config["inference_workers"]),
+        CPU_AFFINITY=str(config["affinity"]),
+        PORT=str(args.port),
+        HOST="127.0.0.1",
+        RESULT_CACHE_SIZE="0",
+    )
+    for name in ("TORCH_NUM_THREADS", "CV2_NUM_THREADS", "ORT_NUM_THREADS"):
+        if config["threads"] == "auto":
+            env.pop(name, None)
+        else:
+            env[name] = str(config["threads"])
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=SERVICE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ok(base_url + "/ready", timeout_s=args.timeout)
+        with urllib.request.urlopen(base_url + "/health", timeout=5) as resp:
+            threads = json.load(resp)["threads"]
+        closed_loop_load(base_url + "/v1/verify-liveness", body, args.clients, 2.0)  # warmup
+        stats = closed_loop_load(base_url + "/v1/verify-liveness", body, args.clients, args.duration)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return {**config, "torch_threads": threads["torch_threads"], "cv2_threads": threads["cv2_threads"], **stats}
+
+
+def mark_frontier(rows: list[dict]) -> None:
+    for row in rows:
+        dominated = any(
+            other["rps"] >= row["rps"] and other["p99_ms"] <= row["p99_ms"]
+            and (other["rps"] > row["rps"] or other["p99_ms"] < row["p99_ms"])
+            for other in rows
+        )
+        row["frontier"] = "" if dominated or not row["requests"] else "*"
+
+
+def main():
+    policy = ThreadPolicy.from_env()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=_default_workers(policy.cpus))
+    parser.add_argument("--threads", nargs="+", default=["auto", "1"], help='threads per worker, or "auto"')
+    parser.add_argument("--inference-workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--affinity", type=int, nargs="+", choices=(0, 1), default=[0])
+    parser.add_argument("--clients", type=int, default=2 * policy.cpus, help="concurrent client connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per configuration")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    body = json.dumps({"image_base64": base64.b64encode(synthetic_jpeg(args.width, args.height)).decode()}).encode()
+    configs = [
+        {"workers": w, "threads": t, "inference_workers": i, "affinity": a}
+        for w, t, i, a in itertools.product(args.workers, args.threads, args.inference_workers, args.affinity)
+    ]
+    rows = []
+    for config in configs:
+        print(f"Running {config} ...", flush=True)
+        rows.append(run_config(config, args, body))
+
+    mark_frontier(rows)
+    rows.sort(key=lambda r: -r["rps"])
+    print(f"Host: {policy.cpus} usable CPUs (affinity {len(policy.cpu_ids)}, cgroup quota {policy.quota}), {args.clients} clients")
+    print_table(rows, [
+        "frontier", "workers", "threads", "inference_workers", "affinity", "torch_threads", "cv2_threads",
+        "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms",
+    ])
+    if args.json:
+        write_json(args.json, {"host": policy.info(), "clients": args.clients, "image": [args.width, args.height], "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Throughput scaling of the gunicorn multi-worker mode from 1 to N workers.
+
+    python benchmarks/bench_workers.py --max-workers 4 --duration 15
+
+For every worker count a fresh `gunicorn -c gunicorn.conf.py main:app` is started,
+then a closed-loop client keeps `concurrency-per-worker * workers` requests in
+flight against /v1/verify-liveness and reports req/s and latency percentiles.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+
+from common import SERVICE_DIR, closed_loop_load, print_table, synthetic_jpeg, wait_until_ok, write_json
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of load per worker count")
+    parser.add_argument("--concurrency-per-worker", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    body = json.dumps({"image_base64": base64.b64encode(synthetic_jpeg(args.width, args.height)).decode()}).encode()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    rows = []
+    for n in range(1, args.max_workers + 1):
+        # Every request sends the same image: without RESULT_CACHE_SIZE=0 this would measure cache hits.
+        env = dict(os.environ, WEB_CONCURRENCY=str(n), PORT=str(args.port), HOST="127.0.0.1", RESULT_CACHE_SIZE="0")
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+            cwd=SERVICE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_ok(base_url + "/ready", timeout_s=120)
+            closed_loop_load(base_url + "/v1/verify-liveness", body, n, 2.0)  # warmup
+            stats = closed_loop_load(base_url + "/v1/verify-liveness", body, n * args.concurrency_per_worker, args.duration)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        stats["workers"] = n
+        rows.append(stats)
+
+    base_rps = rows[0]["rps"] or 1.0
+    for r in rows:
+        r["speedup"] = r["rps"] / base_rps
+    print_table(rows, ["workers", "requests", "errors", "rps", "speedup", "p50_ms", "p95_ms", "p99_ms"])
+    if args.json:
+        write_json(args.json, {"image": [args.width, args.height], "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Shared helpers for the benchmark scripts (synthetic inputs, timing, reporting).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import cv2
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+# Common phone capture resolutions (w, h)
+PHONE_RESOLUTIONS = {
+    "vga": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "12mp": (4000, 3000),
+}
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """
+    Smooth random BGR image (compresses like a photo, unlike pure noise).
+    """
+    rng = np.random.RandomState(seed)
+    small = rng.randint(0, 255, (max(2, height // 32), max(2, width // 32), 3), np.uint8)
+    img = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.randint(0, 16, (height, width, 1), np.uint8)
+    return cv2.add(img, np.repeat(noise, 3, axis=2))
+
+
+def synthetic_jpeg(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    ok, buf = cv2.imencode(".jpg", synthetic_image(width, height, seed), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encode failed")
+    return buf.tobytes()
+
+
+def percentile(samples, q: float) -> float:
+    return float(np.percentile(np.asarray(samples, dtype=np.float64), q)) if samples else 0.0
+
+
+def time_call(fn, repeat: int = 20, warmup: int = 3) -> dict:
+    """
+    Returns latency stats in milliseconds for fn() over `repeat` calls.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return {
+        "mean_ms": float(np.mean(samples)),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "min_ms": float(np.min(samples)),
+        "n": repeat,
+    }
+
+
+def print_table(rows: list[dict], columns: list[str]):
+    widths = {c: max(len(c), *(len(_fmt(r.get(c))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for r in rows:
+        print("  ".join(_fmt(r.get(c)).ljust(widths[c]) for c in columns))
+
+
+def _fmt(v) -> str:
+    if isinstance(v, float):
+        return f"{v:.2f}"
+    return "" if v is None else str(v)
+
+
+def write_json(path: str, payload) -> None:
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+
+
+def wait_until_ok(url: str, timeout_s: float, interval_s: float = 0.2) -> float:
+    """
+    Poll `url` until it answers 200; returns the seconds waited.
+    """
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < timeout_s:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return time.monotonic() - t0
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(interval_s)
+    raise RuntimeError(f"Server did not come up: {url}")
+
+
+def closed_loop_load(url: str, body: bytes, concurrency: int, duration_s: float) -> dict:
+    """
+    `concurrency` clients each POST `body` (JSON) to `url` back to back for `duration_s`.
+    Returns request / error counts, req/s and latency percentiles.
+    """
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration_s
+
+    def client():
+        nonlocal errors
+        while time.monotonic() < stop_at:
+            req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    resp.read()
+                ok = True
+            except (urllib.error.URLError, ConnectionError, OSError):
+                ok = False
+            dt = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                if ok:
+                    latencies.append(dt)
+                else:
+                    errors += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - t0
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
@@ -0,0 +1,65 @@
+"""
+Gunicorn config for multi-worker serving.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+With preload_app the parent imports main.py once (model weights + Haar cascade),
+then forks WEB_CONCURRENCY workers that share those pages copy-on-write.
+With STARTUP_MODE=lazy the parent imports no models; every worker loads its own
+in the background (faster /health, more memory per worker).
+Each worker configures the thread policy (src/threading_policy.py) after fork:
+torch/OpenCV/onnxruntime threads sized to its share of the usable CPUs (cgroup
+quota aware) so N workers don't oversubscribe the CPU, and with CPU_AFFINITY=1
+the worker is pinned to its own CPUs. Workers get a stable slot (0..N-1, reused
+when a worker is replaced) that selects those CPUs.
+
+Metrics: with PROMETHEUS_MULTIPROC_DIR set, /metrics aggregates all workers. The
+directory is emptied here at startup (this file is read before the app is loaded)
+and samples of exited workers are marked dead in child_exit.
+"""
+
+import gc
+import glob
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WORKER_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+
+def _reset_prometheus_dir():
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        return
+    os.makedirs(path, exist_ok=True)
+    for f in glob.glob(os.path.join(path, "*.db")):
+        os.remove(f)
+
+
+_reset_prometheus_dir()
+
+
+def pre_fork(server, worker):
+    # Lowest slot not held by a live worker.
+    taken = {getattr(w, "cpu_slot", None) for w in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+    # Move everything allocated so far (model, cascade, modules) out of the GC's
+    # tracked generations so collections in workers don't touch (and copy) those pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from src import threading_policy
+
+    policy = threading_policy.configure(workers=workers, slot=worker.cpu_slot)
+    server.log.info("Worker %s (slot %s): %s", worker.pid, worker.cpu_slot, policy.info())
+
+
+def child_exit(server, worker):
+    from src.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
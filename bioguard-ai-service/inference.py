@@ -77,16 +77,11 @@ class LivenessDetector:
             except Exception:
                 self.class_count = None
 
-            # If user didn't explicitly set REAL_CLASS_INDEX, choose a best-effort default:
-            # - For 2-class outputs, many exports are [spoof, real] => real=1
-            # - For 3-class outputs in this repo's model, "real" is commonly the last index (2)
+            # If user didn't explicitly set REAL_CLASS_INDEX, use the MiniFASNet mapping
+            # shared with main.py / src.backends: 0=fake, 1=real, 2=unknown.
+            # 2-class exports are [spoof, real], so real=1 there as well.
             if self.real_class_index is None:
-                if self.class_count == 2:
-                    self.real_class_index = 1
-                elif self.class_count == 3:
-                    self.real_class_index = 2
-                else:
-                    self.real_class_index = 1
+                self.real_class_index = 1
 
             print(f"Model loaded successfully: {self.model_path}")
         except Exception as e:
@@ -152,44 +147,70 @@ class LivenessDetector:
             outputs = self.session.run(None, {self.input_name: input_tensor})
 
             # Get prediction
-            raw_output = outputs[0][0]
-
-            # Apply softmax to get probabilities
-            # NOTE: Some exports are binary ([spoof, real]) while others are multi-class
-            # (e.g. 3-class). Always softmax across the last dim.
-            exp_scores = np.exp(raw_output - np.max(raw_output))  # Numerical stability
-            softmax_probs = exp_scores / np.sum(exp_scores)
-
-            probs = [float(x) for x in softmax_probs.tolist()]
-            predicted_class = int(np.argmax(softmax_probs))
-
-            real_idx = int(self.real_class_index) if self.real_class_index is not None else 1
-            if 0 <= real_idx < len(probs):
-                real_score = float(probs[real_idx])
-            else:
-                # Fallback to "most confident" if misconfigured
-                real_score = float(probs[predicted_class])
-
-            is_real = real_score > self.threshold
-
-            processing_time = (time.time() - start_time) * 1000
-
-            return {
-                "is_real": is_real,
-                "confidence": real_score,
-                "threshold": self.threshold,
-                "class_count": int(len(probs)),
-                "real_class_index": real_idx,
-                "predicted_class": predicted_class,
-                "probs": probs,
-                "raw_scores": [float(x) for x in np.asarray(raw_output).tolist()],
-                "processing_time_ms": round(processing_time, 2)
-            }
+            return self._result(outputs[0][0], (time.time() - start_time) * 1000)
 
         except Exception as e:
             print(f"Inference error: {e}")
             return self._demo_predict(image)
 
+    def _result(self, raw_output: np.ndarray, processing_time: float) -> dict:
+        """Result dictionary for one row of model output (see predict())."""
+        # Apply softmax to get probabilities
+        # NOTE: Some exports are binary ([spoof, real]) while others are multi-class
+        # (e.g. 3-class). Always softmax across the last dim.
+        exp_scores = np.exp(raw_output - np.max(raw_output))  # Numerical stability
+        softmax_probs = exp_scores / np.sum(exp_scores)
+
+        probs = [float(x) for x in softmax_probs.tolist()]
+        predicted_class = int(np.argmax(softmax_probs))
+
+        real_idx = int(self.real_class_index) if self.real_class_index is not None else 1
+        if 0 <= real_idx < len(probs):
+            real_score = float(probs[real_idx])
+        else:
+            # Fallback to "most confident" if misconfigured
+            real_score = float(probs[predicted_class])
+
+        is_real = real_score > self.threshold
+
+        return {
+            "is_real": is_real,
+            "confidence": real_score,
+            "threshold": self.threshold,
+            "class_count": int(len(probs)),
+            "real_class_index": real_idx,
+            "predicted_class": predicted_class,
+            "probs": probs,
+            "raw_scores": [float(x) for x in np.asarray(raw_output).tolist()],
+            "processing_time_ms": round(processing_time, 2)
+        }
+
+    def predict_batch(self, images: list[np.ndarray]) -> list[dict]:
+        """
+        Predict liveness for several face images (e.g. every face of one capture)
+        in a single batched inference call.
+
+        Args:
+            images: BGR face regions
+
+        Returns:
+            One result dictionary per image, as returned by predict()
+        """
+        if not self.is_loaded() or len(images) < 2:
+            return [self.predict(image) for image in images]
+
+        start_time = time.time()
+        try:
+            input_tensor = np.concatenate([self.preprocess(image) for image in images])
+            outputs = self.session.run(None, {self.input_name: input_tensor})
+        except Exception as e:
+            # Some exports have a fixed batch size of 1
+            print(f"Batched inference failed ({e}), predicting one by one")
+            return [self.predict(image) for image in images]
+
+        processing_time = (time.time() - start_time) * 1000
+        return [self._result(raw_output, processing_time) for raw_output in outputs[0]]
+
     def _demo_predict(self, image: np.ndarray) -> dict:
         """
         Demo prediction when model is not available.
@@ -270,7 +291,44 @@ class FacePreprocessor:
             return self._center_crop(image, scale)
 
         # Get largest face
-        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        return self._crop_face(image, max(faces, key=lambda f: f[2] * f[3]), scale, pad)
+
+    def detect_and_crop_all(self, image: np.ndarray, scale: float = 2.7, pad: bool = True,
+                            min_size: int = 60, max_faces: int = 0) -> list[dict]:
+        """
+        Detect every face and crop each one with the specified scale.
+
+        Args:
+            image: Input BGR image
+            scale: Scale factor for cropping (default 2.7)
+            min_size: Minimum face size in pixels (shorter side)
+            max_faces: Keep at most this many faces, largest first (0 = all)
+
+        Returns:
+            List of {"bbox_xywh": [x, y, w, h], "cropped": face region}, largest face first;
+            empty if no face detected
+        """
+        if self.face_cascade is None:
+            return []
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces = self.face_cascade.detectMultiScale(
+            gray,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(min_size, min_size)
+        )
+        faces = sorted(faces, key=lambda f: f[2] * f[3], reverse=True)
+        if max_faces > 0:
+            faces = faces[:max_faces]
+        return [
+            {"bbox_xywh": [int(v) for v in face], "cropped": self._crop_face(image, face, scale, pad)}
+            for face in faces
+        ]
+
+    def _crop_face(self, image: np.ndarray, face, scale: float, pad: bool) -> np.ndarray:
+        """Square crop of `scale` x the face size around the face center."""
+        x, y, w, h = face
 
         # Calculate scaled crop region
         center_x = x + w // 2
@@ -6,32 +6,80 @@ BioGuard AI Service - Face Anti-Spoofing (PyTorch .pth)
 - /v1/verify-liveness: JSON API for mobile clients (base64 image)
 """
 
-from fastapi import FastAPI, HTTPException, File, UploadFile, Request
+from fastapi import FastAPI, HTTPException, File, UploadFile, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
+import asyncio
 import base64
+import hmac
 import io
+import json
+import math
 import os
-from typing import Any
+import time
+from contextlib import asynccontextmanager, contextmanager
 
 import cv2
 import numpy as np
 from PIL import Image
 
-from src.anti_spoof_predict import AntiSpoofPredict
+from src.batching import MicroBatcher
+from src import metrics
+from src.concurrency import BoundedExecutor, OverloadedError
 from src.generate_patches import CropImage
-from src.utility import parse_model_name
+from src.image_io import ImageTooLargeError, decode_image, dhash, hamming
+from src.model_registry import ModelRegistry, ModelSet
+from src.profiling import ProfileGate
+from src.request_limits import MaxBodySizeMiddleware
+from src.result_cache import ResultCache
+from src.streaming import LatestFrameSlot, StreamSession
+from src.utility import center_square_bbox
+from src import threading_policy
+from src.video import FaceTracker, VideoError, sample_frames
+
+try:
+    import msgpack
+
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker process (after fork when preloaded). Eager mode finishes startup
+    # before requests are accepted; lazy mode serves /health right away and loads in the background.
+    tasks = [asyncio.create_task(_follow_model_state())] if MODEL_STATE_FILE else []
+    if STARTUP_MODE == "lazy":
+        tasks.append(asyncio.create_task(_startup()))
+    else:
+        await _startup()
+    yield
+    for task in tasks:
+        task.cancel()
+
 
 app = FastAPI(
     title="BioGuard AI Engine",
     description="Face Anti-Spoofing API using MiniFASNetV1SE (.pth)",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Upload limits: MAX_REQUEST_BYTES is checked against Content-Length before the body is read
+# (base64 JSON is ~4/3 of the image size); MAX_IMAGE_BYTES / MAX_IMAGE_PIXELS are checked on the
+# encoded image and its header before decoding. Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale
+# while the longest side stays >= DECODE_TARGET_SIDE (0 = always full resolution).
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(16 * 1024 * 1024)))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "40000000"))
+DECODE_TARGET_SIDE = int(os.getenv("DECODE_TARGET_SIDE", "960"))
+app.add_middleware(MaxBodySizeMiddleware, max_bytes=MAX_REQUEST_BYTES)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -48,18 +96,259 @@ app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), na
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
 # Model config
-MODEL_PATH = os.getenv("MODEL_PATH", os.path.join(BASE_DIR, "models", "4_0_0_80x80_MiniFASNetV1SE.pth"))
-WORKING_MODELS = [os.path.basename(MODEL_PATH)]
-
-# Initialize predictor + cropper once (fast)
-predictor = AntiSpoofPredict(device_id=0)
-predictor.load_model(MODEL_PATH)
+# INFERENCE_BACKEND: "torch" loads the .pth, "onnx" loads the sibling .onnx (see src/export_onnx.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+# MODEL_PATHS (comma-separated) loads several models as an ensemble, e.g. the 2.7 and 4.0 scale pair;
+# scale and input size of each model come from its file name. Paths are mapped to the backend's
+# file type (e.g. .onnx) when the models are loaded.
+_default_model = os.getenv("MODEL_PATH", os.path.join(BASE_DIR, "models", "4_0_0_80x80_MiniFASNetV1SE.pth"))
+MODEL_PATHS = [p.strip() for p in os.getenv("MODEL_PATHS", _default_model).split(",") if p.strip()]
+
+# Startup: STARTUP_MODE=eager loads the models while main.py is imported (what gunicorn's preload_app
+# shares between workers). STARTUP_MODE=lazy keeps torch out of the import and loads the models in a
+# background task started by the lifespan: /health answers immediately, /ready turns 200 once the
+# models are loaded, optimized, warmed up and (STARTUP_CANARY=1) a canary frame went through the
+# pipeline. Model endpoints answer 503 + Retry-After until then.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager")
+STARTUP_CANARY = os.getenv("STARTUP_CANARY", "1") == "1"
+STARTUP_RETRY_AFTER_S = int(os.getenv("STARTUP_RETRY_AFTER_S", "2"))
+startup = {"mode": STARTUP_MODE, "state": "starting", "error": None, "timings_s": {}}
+_process_t0 = time.perf_counter()
+
+# CPU threading: torch / OpenCV / onnxruntime thread counts derived from the usable CPUs (affinity
+# mask, cgroup quota), WEB_CONCURRENCY workers and INFERENCE_WORKERS concurrent requests per worker;
+# see src/threading_policy.py for the rule and the overrides (TORCH_NUM_THREADS, CV2_NUM_THREADS,
+# ORT_NUM_THREADS, CPU_LIMIT, CPU_AFFINITY). gunicorn.conf.py configures it again in every worker.
+threading_policy.current()
+
+# Fast face detection: run the Haar cascade on a copy downscaled to DETECT_MAX_SIDE (0 = full resolution);
+# the bbox is mapped back to original coordinates before cropping.
+DETECT_MAX_SIDE = int(os.getenv("DETECT_MAX_SIDE", "0"))
+
+# Load-time optimization (torch backend): Conv+BN fusion, TorchScript trace+freeze
+# (MODEL_JIT=trace) or torch.compile (MODEL_JIT=compile), channels-last; then warmup
+# forwards for WARMUP_BATCH_SIZES. Done per worker in the lifespan hook, not at import.
+MODEL_OPTIMIZE = os.getenv("MODEL_OPTIMIZE", "1") == "1"
+MODEL_JIT = os.getenv("MODEL_JIT", "trace")
+MODEL_CHANNELS_LAST = os.getenv("MODEL_CHANNELS_LAST", "1") == "1"
+WARMUP_BATCH_SIZES = [int(x) for x in os.getenv("WARMUP_BATCH_SIZES", "1,4,16").split(",") if x.strip()]
+
+# Micro-batching: concurrent /v1/verify-liveness requests share one forward.
+# Waiting up to MICRO_BATCH_MAX_WAIT_MS trades a few ms of latency for throughput.
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "0") == "1"
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "16"))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "5"))
+
+# Model registry: POST /admin/models/load loads new weights in the background, optimizes, warms
+# up and canary-checks them, then swaps them in for new requests while in-flight requests finish
+# on the old set; POST /admin/models/rollback swaps back. Admin endpoints are off unless
+# ADMIN_TOKEN is set (send it as X-Admin-Token); their model paths must stay inside MODEL_DIR.
+# With several workers set MODEL_STATE_FILE to a shared path: a rollout is recorded there, every
+# worker follows it within MODEL_STATE_POLL_S, and (re)started workers load what it names.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+MODEL_DIR = os.getenv("MODEL_DIR", os.path.join(BASE_DIR, "models"))
+MODEL_STATE_FILE = os.getenv("MODEL_STATE_FILE", "")
+MODEL_STATE_POLL_S = float(os.getenv("MODEL_STATE_POLL_S", "2"))
+MODEL_DRAIN_TIMEOUT_S = float(os.getenv("MODEL_DRAIN_TIMEOUT_S", "30"))
+registry = ModelRegistry(MODEL_DRAIN_TIMEOUT_S)
 image_cropper = CropImage()
 
 
+def _models() -> ModelSet:
+    """
+    The model set serving the current request (pinned at admission), else the active one.
+    """
+    return registry.current()
+
+
+def _read_model_state() -> list[str] | None:
+    if not MODEL_STATE_FILE or not os.path.exists(MODEL_STATE_FILE):
+        return None
+    try:
+        with open(MODEL_STATE_FILE) as f:
+            return list(json.load(f)["model_paths"]) or None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Ignoring unreadable {MODEL_STATE_FILE}: {e}")
+        return None
+
+
+def _write_model_state(models: ModelSet) -> None:
+    if not MODEL_STATE_FILE:
+        return
+    tmp = f"{MODEL_STATE_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"model_paths": models.paths, "version": models.version, "updated_at": time.time()}, f)
+    os.replace(tmp, MODEL_STATE_FILE)
+
+
+MODEL_PATHS = _read_model_state() or MODEL_PATHS
+
+
+def _load_models(paths) -> ModelSet:
+    """
+    Import the inference backends (torch only for the torch backends) and load every model
+    in `paths` as a new ModelSet.
+    """
+    from src.backends import create_predictor, resolve_model_path
+
+    threading_policy.current().apply()  # torch / onnxruntime are imported now
+    t0 = time.perf_counter()
+    paths = [resolve_model_path(INFERENCE_BACKEND, p) for p in paths]
+    loaded = {os.path.basename(p): create_predictor(INFERENCE_BACKEND, p, device_id=0) for p in paths}
+    loaded[os.path.basename(paths[0])].detect_max_side = DETECT_MAX_SIDE
+    batcher_factory = (
+        (lambda predict_fn: MicroBatcher(predict_fn, MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS)) if MICRO_BATCHING else None
+    )
+    models = ModelSet(INFERENCE_BACKEND, paths, loaded, image_cropper, batcher_factory)
+    startup["timings_s"].setdefault("load", round(time.perf_counter() - t0, 3))
+    return models
+
+
+def _prepare_models(models: ModelSet):
+    from src.backends import warmup
+
+    t0 = time.perf_counter()
+    for name, model_predictor in models.predictors.items():
+        if MODEL_OPTIMIZE and INFERENCE_BACKEND == "torch":
+            try:
+                diff = model_predictor.optimize(jit=MODEL_JIT, channels_last=MODEL_CHANNELS_LAST)
+                print(f"{name} optimized (jit={MODEL_JIT}, channels_last={MODEL_CHANNELS_LAST}, max prob diff {diff:.2e})")
+            except Exception as e:
+                print(f"{name} optimization skipped, serving unoptimized model: {e}")
+        warmup(model_predictor, model_predictor.input_size, WARMUP_BATCH_SIZES)
+    startup["timings_s"].setdefault("prepare", round(time.perf_counter() - t0, 3))
+
+
+def _canary(models: ModelSet):
+    """
+    Run one synthetic frame through decode -> detect -> crop -> every model and check the output.
+    Bypasses the request helpers so metrics and caches are not touched.
+    """
+    t0 = time.perf_counter()
+    frame = cv2.resize(np.arange(48, dtype=np.uint8).reshape(6, 8), (640, 480), interpolation=cv2.INTER_LINEAR)
+    _ok, jpeg = cv2.imencode(".jpg", cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+    image_bgr, reduction = decode_image(jpeg.tobytes(), MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS, DECODE_TARGET_SIDE)
+    if image_bgr is None:
+        raise RuntimeError("Canary frame could not be decoded")
+    try:
+        bbox = models.predictor.get_bbox(image_bgr, reduction)
+    except RuntimeError:
+        bbox = center_square_bbox(image_bgr)
+    for name, (probs, _ms) in zip(models.names, models.ensemble.predict(models.ensemble.crop(image_bgr, bbox))):
+        if probs.shape != (1, 3) or not np.all(np.isfinite(probs)) or abs(float(probs.sum()) - 1.0) > 1e-3:
+            raise RuntimeError(f"Canary inference returned invalid probabilities for {name}: {probs}")
+    startup["timings_s"].setdefault("canary", round(time.perf_counter() - t0, 3))
+
+
+def _build_models(paths) -> ModelSet:
+    """
+    Load, optimize, warm up and (STARTUP_CANARY=1) canary-check a new model set; used for reloads.
+    """
+    models = _load_models(paths)
+    try:
+        _prepare_models(models)
+        if STARTUP_CANARY:
+            _canary(models)
+    except Exception:
+        models.close()
+        raise
+    return models
+
+
+def _on_models_changed():
+    if result_cache is not None:
+        result_cache.set_version(_model_version())
+
+
+async def _startup():
+    try:
+        models = registry.active
+        if models is None:
+            models = await asyncio.to_thread(_load_models, MODEL_PATHS)
+        await asyncio.to_thread(_prepare_models, models)
+        if STARTUP_CANARY:
+            await asyncio.to_thread(_canary, models)
+        if registry.active is not models:
+            registry.activate(models)
+        _on_models_changed()
+    except Exception as e:
+        startup["state"] = "failed"
+        startup["error"] = str(e)
+        print(f"Startup failed: {e}")
+        if STARTUP_MODE != "lazy":
+            raise
+        return
+    startup["state"] = "ready"
+    startup["timings_s"]["ready_after"] = round(time.perf_counter() - _process_t0, 3)
+    print(f"Ready ({STARTUP_MODE} startup): {startup['timings_s']}")
+
+
+async def _follow_model_state():
+    """
+    Keep this worker on the models named in MODEL_STATE_FILE (written by any worker's admin call).
+    """
+    last_mtime = None
+    while True:
+        await asyncio.sleep(MODEL_STATE_POLL_S)
+        try:
+            mtime = os.path.getmtime(MODEL_STATE_FILE)
+        except OSError:
+            continue
+        if mtime == last_mtime or startup["state"] != "ready" or registry.busy:
+            continue
+        last_mtime = mtime
+        paths = _read_model_state()
+        if not paths or paths == registry.active.paths:
+            continue
+        try:
+            if registry.previous is not None and paths == registry.previous.paths:
+                await registry.rollback()
+            else:
+                await registry.load(_build_models, paths)
+            _on_models_changed()
+        except Exception as e:
+            print(f"Failed to follow {MODEL_STATE_FILE}: {e}")
+
+
+def _require_ready():
+    if startup["state"] != "ready":
+        raise HTTPException(
+            status_code=503,
+            detail="Model is loading" if startup["state"] == "starting" else "Model failed to load",
+            headers={"Retry-After": str(STARTUP_RETRY_AFTER_S)},
+        )
+
+
+@contextmanager
+def _serving_models():
+    """
+    Admit a model request: 503 until ready, then pin the active model set until the request ends.
+    """
+    _require_ready()
+    with registry.acquire() as models:
+        yield models
+
+
+if STARTUP_MODE != "lazy":
+    registry.activate(_load_models(MODEL_PATHS), "load")
+
+# CPU-bound work (decode, detect, crop, infer) runs off the event loop on a bounded pool.
+# Requests beyond INFERENCE_WORKERS + INFERENCE_QUEUE_DEPTH are rejected with 503 + Retry-After.
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_QUEUE_DEPTH = int(os.getenv("INFERENCE_QUEUE_DEPTH", "32"))
+OVERLOAD_RETRY_AFTER_S = int(os.getenv("OVERLOAD_RETRY_AFTER_S", "1"))
+pipeline_executor = BoundedExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_DEPTH)
+
+
+class ModelLoadRequest(BaseModel):
+    """Admin request: model files to load as the new model set (first one also detects faces)"""
+    model_paths: list[str]
+
+
 class LivenessRequest(BaseModel):
     """Request model for liveness verification"""
     image_base64: str
+    multi_face: bool = False
 
 
 class LivenessResponse(BaseModel):
@@ -71,82 +360,183 @@ class LivenessResponse(BaseModel):
     details: dict = {}
 
 
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, retry later"},
+        headers={"Retry-After": str(OVERLOAD_RETRY_AFTER_S)},
+    )
+
+
+@app.exception_handler(ImageTooLargeError)
+async def too_large_handler(request: Request, exc: ImageTooLargeError):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {
         "status": "ok",
         "service": "BioGuard AI Engine",
-        "model": os.path.basename(MODEL_PATH),
+        "model": registry.active.version if registry.active is not None else os.path.basename(MODEL_PATHS[0]),
         "version": "1.0.0"
     }
 
 
+def _require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("x-admin-token") or ""
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+def _admin_model_path(name: str) -> str:
+    root = os.path.realpath(MODEL_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep):
+        raise HTTPException(status_code=400, detail=f"Model path must be inside MODEL_DIR: {name}")
+    return path
+
+
+def _require_idle_registry():
+    if startup["state"] != "ready":
+        raise HTTPException(status_code=409, detail="Startup has not finished")
+    if registry.busy:
+        raise HTTPException(status_code=409, detail="A model load is already running")
+
+
+@app.get("/admin/models")
+async def admin_models(request: Request):
+    """Active and previous model sets, last load state and swap history"""
+    _require_admin(request)
+    return registry.info()
+
+
+@app.post("/admin/models/load")
+async def admin_load_models(body: ModelLoadRequest, request: Request):
+    """
+    Load model files (relative to MODEL_DIR) in the background and swap them in once warmed up.
+    Returns when the swap is done; the active set keeps serving meanwhile and on failure.
+    """
+    _require_admin(request)
+    _require_idle_registry()
+    paths = [_admin_model_path(p) for p in body.model_paths]
+    if not paths:
+        raise HTTPException(status_code=400, detail="model_paths is empty")
+    try:
+        models = await registry.load(_build_models, paths)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Model load failed, still serving {registry.active.version}: {e}")
+    _on_models_changed()
+    _write_model_state(models)
+    return registry.info()
+
+
+@app.post("/admin/models/rollback")
+async def admin_rollback_models(request: Request):
+    """Swap the previous model set back in (no reload)"""
+    _require_admin(request)
+    _require_idle_registry()
+    try:
+        models = await registry.rollback()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    _on_models_changed()
+    _write_model_state(models)
+    return registry.info()
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics (all workers when PROMETHEUS_MULTIPROC_DIR is set)"""
+    if not metrics.PROMETHEUS_AVAILABLE:
+        raise HTTPException(status_code=404, detail="prometheus_client is not installed")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/health")
 async def health():
-    """Detailed health check"""
-    return {
-        "status": "healthy",
-        "model_loaded": True,
-        "model_path": MODEL_PATH
+    """Liveness: the process is up (503 only when startup failed for good)"""
+    content = {
+        "status": "unhealthy" if startup["state"] == "failed" else "healthy",
+        "model_loaded": registry.active is not None,
+        "ready": startup["state"] == "ready",
+        "model_version": registry.active.version if registry.active is not None else None,
+        "model_path": registry.active.paths[0] if registry.active is not None else MODEL_PATHS[0],
+        "models": registry.active.names if registry.active is not None else [os.path.basename(p) for p in MODEL_PATHS],
+        "model_registry": registry.info(),
+        "backend": INFERENCE_BACKEND,
+        "threads": threading_policy.current().info(),
+        "startup": startup,
+        "result_cache": result_cache.stats() if result_cache is not None else None,
     }
+    return JSONResponse(status_code=503 if startup["state"] == "failed" else 200, content=content)
 
-def _validate_image(image_bytes: bytes) -> bool:
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-        image.verify()
-        return True
-    except Exception:
-        return False
 
+@app.get("/ready")
+async def ready():
+    """Readiness: models loaded, optimized, warmed up and canary passed"""
+    content = {"ready": startup["state"] == "ready", "startup": startup}
+    if startup["state"] != "ready":
+        return JSONResponse(status_code=503, content=content, headers={"Retry-After": str(STARTUP_RETRY_AFTER_S)})
+    return content
 
-def _preprocess_image(image_bytes: bytes) -> np.ndarray:
+def _decode_image_bytes(image_bytes) -> tuple[np.ndarray | None, int]:
     """
-    Convert image bytes -> OpenCV BGR ndarray (keep original size).
+    Single-pass, size-limited decode to an OpenCV BGR ndarray.
+    Returns (image, reduction): large JPEGs are decoded at 1/reduction scale;
+    multiply coordinates by `reduction` to map them back to the uploaded image.
     """
-    image = Image.open(io.BytesIO(image_bytes))
-    if image.mode != "RGB":
-        image = image.convert("RGB")
-    img_array = np.array(image)
-    img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-    return img_array
+    with metrics.timed("decode"):
+        return decode_image(image_bytes, MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS, DECODE_TARGET_SIDE)
 
 
-def _fallback_center_bbox(image_bgr: np.ndarray):
-    h, w = image_bgr.shape[:2]
-    size = min(w, h)
-    cx, cy = w // 2, h // 2
-    return [int(cx - size // 2), int(cy - size // 2), int(size), int(size)]
+def _to_original_bbox(bbox, reduction: int):
+    return [int(v * reduction) for v in bbox] if reduction != 1 else bbox
 
 
-def _predict_face_authenticity(image_bgr: np.ndarray, bbox):
+def _detect_bbox(image_bgr: np.ndarray, reduction: int = 1, fallback=None):
     """
-    Implements the same loop style as the reference test.py:
-    - parse model name
-    - crop via CropImage
-    - predict via AntiSpoofPredict
+    Largest face as [x, y, w, h] (decoded image coordinates; `reduction` from the decode keeps
+    the minimum face size in uploaded pixels). When no face is found, returns `fallback` if
+    given, else the center square. Returns (bbox, face_found).
     """
-    prediction = np.zeros((1, 3), dtype=np.float32)
-    num_models = len(WORKING_MODELS)
+    with metrics.timed("detect"):
+        try:
+            bbox, found = _models().predictor.get_bbox(image_bgr, reduction), True
+        except Exception:
+            bbox, found = (fallback if fallback is not None else center_square_bbox(image_bgr)), False
+    metrics.count_detection(found)
+    return bbox, found
 
-    for model_name in WORKING_MODELS:
-        h_input, w_input, _model_type, scale = parse_model_name(model_name)
-        param: dict[str, Any] = {
-            "org_img": image_bgr,
-            "bbox": bbox,
-            "scale": scale if scale is not None else 1.0,
-            "out_w": w_input,
-            "out_h": h_input,
-            "crop": True,
-        }
-        if scale is None:
-            param["crop"] = False
 
-        cropped_img = image_cropper.crop(**param)
-        result = predictor.predict(cropped_img)  # (1,3)
-        prediction += result.astype(np.float32)
+def _crop_for_models(image_bgr: np.ndarray, bbox):
+    """
+    One crop per model of the serving model set (scale/input size come from the model name);
+    models with the same crop spec share a single crop.
+    """
+    with metrics.timed("crop"):
+        return _models().ensemble.crop(image_bgr, bbox)
+
 
+def _probabilities(row: np.ndarray) -> dict:
+    # label: 0=fake, 1=real, 2=unknown
+    return {"real": float(row[1]), "fake": float(row[0]), "unknown": float(row[2])}
+
+
+def _summarize_prediction(prediction: np.ndarray, per_model=None):
+    """
+    prediction: (1,3) sum of per-model softmax outputs.
+    per_model: optional [(probs (3,), time_ms)] in model set order, reported under "models".
+    """
+    names = _models().names
+    num_models = len(names)
     label = int(np.argmax(prediction))
+    metrics.count_result(label)
     value = float(prediction[0][label] / num_models)
 
     # label: 0=fake, 1=real, 2=unknown
@@ -155,12 +545,62 @@ def _predict_face_authenticity(image_bgr: np.ndarray, bbox):
     prob_real = float(prediction[0][1] / num_models)
     prob_unknown = float(prediction[0][2] / num_models)
 
-    return {
+    result = {
         "is_real": is_real,
         "confidence": float(value),
         "probabilities": {"real": prob_real, "fake": prob_fake, "unknown": prob_unknown},
         "label": label,
     }
+    if per_model is not None:
+        result["models"] = {
+            name: {"probabilities": _probabilities(probs), "time_ms": round(float(ms), 3)}
+            for name, (probs, ms) in zip(names, per_model)
+        }
+    return result
+
+
+def _predict_crops(crops: list[np.ndarray]):
+    """
+    crops: one crop per model of the serving model set (see _crop_for_models()).
+    All models run concurrently.
+    """
+    metrics.observe_batch(1)
+    with metrics.timed("inference"):
+        per_model = [(probs[0], ms) for probs, ms in _models().ensemble.predict(crops)]
+    prediction = np.zeros((1, 3), dtype=np.float32)
+    for probs, _ms in per_model:
+        prediction[0] += probs.astype(np.float32)
+    return _summarize_prediction(prediction, per_model)
+
+
+def _predict_face_authenticity(image_bgr: np.ndarray, bbox):
+    """
+    Implements the same loop style as the reference test.py:
+    - parse model name
+    - crop via CropImage
+    - predict via AntiSpoofPredict
+    """
+    return _predict_crops(_crop_for_models(image_bgr, bbox))
+
+
+async def _predict_crops_batched(crops: list[np.ndarray]):
+    """
+    Same as _predict_crops(), but each crop goes through its model's micro-batcher.
+    Also reports the batch size the request was served in.
+    """
+    t0 = time.perf_counter()
+    batchers = _models().batchers
+    futures = [asyncio.wrap_future(batchers[name].submit(crop)) for name, crop in zip(_models().names, crops)]
+    rows = await asyncio.gather(*futures)
+    elapsed_ms = (time.perf_counter() - t0) * 1000.0
+    metrics.add_request_timing("inference", elapsed_ms / 1000.0)
+    prediction = np.zeros((1, 3), dtype=np.float32)
+    for probs, _batch_size in rows:
+        prediction[0] += probs.astype(np.float32)
+    # Per-model time here is the time until that model's batch resolved (includes the batching wait).
+    result = _summarize_prediction(prediction, [(probs, elapsed_ms) for probs, _batch_size in rows])
+    result["batch_size"] = max(batch_size for _probs, batch_size in rows)
+    return result
 
 
 REAL_PROB_THRESHOLD = float(os.getenv("REAL_PROB_THRESHOLD", "0.8"))
@@ -189,27 +629,10 @@ async def demo(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
-@app.post("/api/predict")
-async def api_predict(file: UploadFile = File(...)):
-    if not (file.content_type or "").startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
-
-    image_bytes = await file.read()
-    if not image_bytes:
-        raise HTTPException(status_code=400, detail="Empty file uploaded")
-    if not _validate_image(image_bytes):
-        raise HTTPException(status_code=400, detail="Invalid image file")
-
-    image_bgr = _preprocess_image(image_bytes)
-
-    try:
-        bbox = predictor.get_bbox(image_bgr)
-    except Exception:
-        bbox = _fallback_center_bbox(image_bgr)
-
-    result = _apply_real_threshold(_predict_face_authenticity(image_bgr, bbox))
-
-    # Base64 images for UI
+def _preview_images(image_bgr: np.ndarray, bbox, is_real: bool):
+    """
+    Base64 JPEGs for the demo UI: the image, and the image with the bbox drawn.
+    """
     pil_image = Image.fromarray(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB))
     buf = io.BytesIO()
     pil_image.save(buf, format="JPEG")
@@ -218,69 +641,397 @@ async def api_predict(file: UploadFile = File(...)):
     # Draw bbox
     image_with_bbox = image_bgr.copy()
     x, y, w, h = bbox
-    color = (0, 255, 0) if result["is_real"] else (0, 0, 255)
+    color = (0, 255, 0) if is_real else (0, 0, 255)
     cv2.rectangle(image_with_bbox, (x, y), (x + w, y + h), color, 3)
     bbox_pil = Image.fromarray(cv2.cvtColor(image_with_bbox, cv2.COLOR_BGR2RGB))
     buf2 = io.BytesIO()
     bbox_pil.save(buf2, format="JPEG")
     bbox_img_str = base64.b64encode(buf2.getvalue()).decode()
+    return img_str, bbox_img_str
 
-    return {"filename": file.filename, "result": result, "image_data": img_str, "bbox_image_data": bbox_img_str, "bbox": bbox}
 
+def _api_predict_pipeline(image_bytes: bytes) -> dict:
+    image_bgr, reduction = _decode_image_bytes(image_bytes)
+    if image_bgr is None:
+        raise HTTPException(status_code=400, detail="Invalid image file")
 
-@app.post("/v1/verify-liveness", response_model=LivenessResponse)
-async def verify_liveness(request: LivenessRequest):
+    bbox, _found = _detect_bbox(image_bgr, reduction)
+
+    result = _apply_real_threshold(_predict_face_authenticity(image_bgr, bbox))
+
+    with metrics.timed("serialize"):
+        img_str, bbox_img_str = _preview_images(image_bgr, bbox, result["is_real"])
+
+    # bbox is reported in uploaded-image coordinates; the preview images are the decoded (possibly reduced) ones.
+    return {
+        "result": result,
+        "image_data": img_str,
+        "bbox_image_data": bbox_img_str,
+        "bbox": _to_original_bbox(bbox, reduction),
+    }
+
+
+@app.post("/api/predict")
+async def api_predict(file: UploadFile = File(...)):
+    _require_ready()
+    if not (file.content_type or "").startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    image_bytes = await file.read()
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="Empty file uploaded")
+
+    with _serving_models():
+        async with pipeline_executor.admit():
+            out = await pipeline_executor.run(_api_predict_pipeline, image_bytes)
+
+    return {"filename": file.filename, **out}
+
+
+def _detect_and_crop(image_bgr: np.ndarray, reduction: int):
     """
-    Mobile API: accepts base64 image, runs .pth anti-spoofing and returns a compact result.
+    Detect -> crop on a decoded image. Returns (bbox in original image coordinates, crops).
     """
-    try:
-        image_bgr = decode_base64_image(request.image_base64)
-        if image_bgr is None:
-            raise HTTPException(status_code=400, detail="Invalid image data")
+    bbox, _found = _detect_bbox(image_bgr, reduction)
+
+    return _to_original_bbox(bbox, reduction), _crop_for_models(image_bgr, bbox)
+
 
+# Multi-face mode (opt-in per request: "multi_face": true, or ?multi_face=true on the raw
+# endpoint): every face whose shorter side is at least MULTI_FACE_MIN_SIZE pixels (uploaded
+# image) is cropped and scored in one batched forward, largest first, at most MULTI_FACE_MAX_FACES.
+MULTI_FACE_MIN_SIZE = int(os.getenv("MULTI_FACE_MIN_SIZE", "60"))
+MULTI_FACE_MAX_FACES = int(os.getenv("MULTI_FACE_MAX_FACES", "8"))
+
+
+def _detect_bboxes(image_bgr: np.ndarray, reduction: int):
+    """
+    Every face for multi-face mode as [x, y, w, h] (decoded image coordinates), largest first.
+    When no face is found, returns the center square. Returns (bboxes, face_found).
+    """
+    min_size = -(-MULTI_FACE_MIN_SIZE // reduction)  # decoded pixels, rounded up
+    with metrics.timed("detect"):
         try:
-            bbox = predictor.get_bbox(image_bgr)
+            bboxes = _models().predictor.get_bboxes(image_bgr, min_size, MULTI_FACE_MAX_FACES)
         except Exception:
-            bbox = _fallback_center_bbox(image_bgr)
+            bboxes = []
+    found = bool(bboxes)
+    metrics.count_detection(found)
+    return (bboxes if found else [center_square_bbox(image_bgr)]), found
 
-        r = _apply_real_threshold(_predict_face_authenticity(image_bgr, bbox))
 
+def _decode_and_crop(image_bytes):
+    """
+    Decode -> detect -> crop for one request (encoded image bytes, decoded straight from the buffer).
+    Runs on the pipeline executor. Returns (bbox in original image coordinates, crops).
+    """
+    image_bgr, reduction = _decode_image_bytes(image_bytes)
+    if image_bgr is None:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    return _detect_and_crop(image_bgr, reduction)
+
+
+def _decode_and_crop_faces(image_bytes):
+    """
+    Multi-face variant of _decode_and_crop(): decode -> detect every face -> crop all faces
+    for all models in one pass. Returns (bboxes in original image coordinates, per-face crops, face_found).
+    """
+    image_bgr, reduction = _decode_image_bytes(image_bytes)
+    if image_bgr is None:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    bboxes, found = _detect_bboxes(image_bgr, reduction)
+    with metrics.timed("crop"):
+        face_crops = _models().ensemble.crop_many(image_bgr, bboxes)
+    return [_to_original_bbox(bbox, reduction) for bbox in bboxes], face_crops, found
+
+
+def _verify_faces_pipeline(image_bytes):
+    """
+    Multi-face mode: every face scored in one batched forward per model.
+    Returns (results with bbox, largest face first; face_found).
+    """
+    bboxes, face_crops, found = _decode_and_crop_faces(image_bytes)
+    results = [_apply_real_threshold(r) for r in _predict_many(face_crops)]
+    for bbox, r in zip(bboxes, results):
+        r["bbox"] = bbox
+    return results, found
+
+
+def _face_summary(r: dict) -> dict:
+    return {
+        "bbox": r["bbox"],
+        "is_real": bool(r["is_real"]),
+        "confidence": float(r["confidence"]),
+        "probabilities": r.get("probabilities", {}),
+        "label": r.get("label"),
+    }
+
+
+async def _verify_liveness(image_bytes, multi_face: bool = False) -> LivenessResponse:
+    try:
+        faces = None
+        async with pipeline_executor.admit():
+            if multi_face:
+                faces, found = await pipeline_executor.run(_verify_faces_pipeline, image_bytes)
+                # The largest face decides the top-level verdict, as in single-face mode.
+                r, bbox = faces[0], faces[0]["bbox"]
+                r["batch_size"] = len(faces)
+            else:
+                bbox, crops = await pipeline_executor.run(_decode_and_crop, image_bytes)
+
+                if MICRO_BATCHING:
+                    r = await _predict_crops_batched(crops)
+                else:
+                    r = await pipeline_executor.run(_predict_crops, crops)
+        if faces is None:
+            r = _apply_real_threshold(r)
+
+        details = {
+            "bbox": bbox,
+            "probabilities": r.get("probabilities", {}),
+            "label": r.get("label"),
+            "model": _models().version,
+            "real_prob_threshold": float(r["threshold"]),
+            "batch_size": int(r.get("batch_size", 1)),
+            "models": r.get("models", {}),
+        }
+        if faces is not None:
+            details["face_detected"] = found
+            details["faces"] = [_face_summary(face) for face in faces] if found else []
         return LivenessResponse(
             is_real=bool(r["is_real"]),
             confidence=float(r["confidence"]),
             threshold=float(r["threshold"]),
             message="Real face detected" if r["is_real"] else "Spoof detected",
-            details={
-                "bbox": bbox,
-                "probabilities": r.get("probabilities", {}),
-                "label": r.get("label"),
-                "model": os.path.basename(MODEL_PATH),
-                "real_prob_threshold": float(r["threshold"]),
-            },
+            details=details,
         )
-    except HTTPException:
+    except (HTTPException, OverloadedError, ImageTooLargeError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
 
 
-@app.post("/v1/batch-verify")
-async def batch_verify(images: list[LivenessRequest]):
-    results = []
+def _model_version() -> str:
+    """
+    Identifies what produces a response (active model set version, decision threshold); part of the cache key.
+    """
+    return f"{registry.active.version}:{REAL_PROB_THRESHOLD}"
+
+
+# Result cache: retried uploads of the same image bytes return the stored response, and
+# concurrent identical requests share one computation. RESULT_CACHE_SIZE=0 disables it.
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "30"))
+# The version is set once the models are loaded (see _startup()).
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL_S) if RESULT_CACHE_SIZE > 0 else None
+
+
+def _prepare_payload(image_bytes, image_base64: str | None, variant: str):
+    """
+    Base64 decode (when image_base64 is given) and result cache key: O(payload size), so it
+    runs on the pipeline executor, not the event loop. Returns (image bytes or None, key or None).
+    """
+    if image_base64 is not None:
+        image_bytes = _base64_payload(image_base64)
+    if not image_bytes or result_cache is None:
+        return image_bytes, None
+    return image_bytes, result_cache.key(image_bytes, variant)
+
+
+async def _cached_verify_liveness(
+    response: Response, multi_face: bool = False, image_bytes=None, image_base64: str | None = None
+) -> LivenessResponse:
+    """
+    image_bytes: encoded image, or image_base64: its base64 (data URL) form.
+    Only the cache lookup runs on the event loop.
+    """
+    variant = "faces" if multi_face else ""
+    async with pipeline_executor.admit():
+        image_bytes, key = await pipeline_executor.run(_prepare_payload, image_bytes, image_base64, variant)
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    if result_cache is None:
+        return await _verify_liveness(image_bytes, multi_face)
+    result, status = await result_cache.get_or_compute(
+        image_bytes, lambda: _verify_liveness(image_bytes, multi_face), variant=variant, key=key
+    )
+    response.headers["X-Cache"] = status
+    return result
+
+
+# Per-request diagnostics (no-op unless enabled):
+# - STAGE_TIMINGS=1 adds details.timings_ms and a Server-Timing header to verify responses.
+# - PROFILE_TOKEN enables profiling: a request with header X-Profile-Token: <token>, or a random
+#   PROFILE_SAMPLE_RATE fraction of requests, is profiled (at most PROFILE_MAX_PER_MINUTE per
+#   worker) and the profile is written to PROFILE_DIR (pyinstrument HTML, else cProfile .prof).
+STAGE_TIMINGS = os.getenv("STAGE_TIMINGS", "0") == "1"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MAX_PER_MINUTE = int(os.getenv("PROFILE_MAX_PER_MINUTE", "6"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+profile_gate = ProfileGate(PROFILE_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_MAX_PER_MINUTE)
+
+
+@asynccontextmanager
+async def _diagnostics(http_request: Request, response: Response, name: str):
+    """
+    Stage timings and optional profiling around one request. Yields the timings dict
+    (stage -> seconds, filled while the block runs) or None; on exit sets Server-Timing
+    (and X-Profile with the profile file name) on `response`.
+    """
+    if not STAGE_TIMINGS and not profile_gate.enabled:
+        yield None
+        return
+
+    t0 = time.perf_counter()
+    timings_token = metrics.start_request_timings() if STAGE_TIMINGS else None
+    started = profile_gate.start(http_request.headers.get("x-profile-token"), name)
+    try:
+        yield metrics.request_timings()
+    finally:
+        profile = profile_gate.finish(started)
+        if timings_token is not None:
+            timings = metrics.request_timings()
+            metrics.stop_request_timings(timings_token)
+            timings["total"] = time.perf_counter() - t0
+            response.headers["Server-Timing"] = ", ".join(f"{stage};dur={sec * 1000.0:.2f}" for stage, sec in timings.items())
+        if profile is not None:
+            path = await asyncio.to_thread(profile.save, PROFILE_DIR)
+            if path:
+                print(f"Profile written: {path}")
+                response.headers["X-Profile"] = os.path.basename(path)
+
+
+@app.post("/v1/verify-liveness", response_model=LivenessResponse)
+async def verify_liveness(request: LivenessRequest, http_request: Request, response: Response):
+    """
+    Mobile API: accepts base64 image, runs .pth anti-spoofing and returns a compact result.
+    """
+    with _serving_models():
+        async with _diagnostics(http_request, response, "verify-liveness") as timings:
+            result = await _cached_verify_liveness(response, request.multi_face, image_base64=request.image_base64)
+    return _liveness_response(result, response, timings=timings)
+
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+def _liveness_response(result: LivenessResponse, response: Response, accept: str = "", timings=None) -> Response:
+    """
+    Serialize here (JSON, or msgpack when `accept` asks for it) so the time is measured;
+    headers set on `response` are carried over. `timings` (stage -> seconds) go to details.timings_ms.
+    """
+    if timings is not None:
+        # Copy: `result` may be shared through the result cache.
+        timings_ms = {stage: round(sec * 1000.0, 3) for stage, sec in timings.items()}
+        result = result.model_copy(update={"details": {**result.details, "timings_ms": timings_ms}})
+    with metrics.timed("serialize"):
+        if MSGPACK_AVAILABLE and any(t in accept for t in MSGPACK_MEDIA_TYPES):
+            content, media_type = msgpack.packb(result.model_dump()), "application/msgpack"
+        else:
+            content, media_type = result.model_dump_json(), "application/json"
+    return Response(content=content, media_type=media_type, headers=dict(response.headers))
+
+
+async def _read_raw_image(request: Request, kind: str = "image") -> bytes:
+    """
+    Body bytes of an application/octet-stream or `kind`/* upload, or the 'file' part of a multipart body.
+    """
+    content_type = (request.headers.get("content-type") or "").lower()
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file") or form.get(kind)
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Multipart body must contain a 'file' part")
+        return await upload.read()
+    if content_type.startswith(("application/octet-stream", f"{kind}/")):
+        return await request.body()
+    raise HTTPException(status_code=415, detail=f"Send raw {kind} bytes (application/octet-stream, {kind}/*) or multipart/form-data")
+
+
+@app.post("/v1/verify-liveness/raw", response_model=LivenessResponse)
+async def verify_liveness_raw(request: Request, response: Response, multi_face: bool = False):
+    """
+    Binary variant of /v1/verify-liveness: the body is the encoded image itself
+    (application/octet-stream / image/jpeg) or a multipart 'file' part, so there is no
+    base64 overhead. Same response; sent as msgpack when the Accept header asks for it.
+    Multi-face mode is enabled with the query parameter ?multi_face=true.
+    """
+    with _serving_models():
+        async with _diagnostics(request, response, "verify-liveness-raw") as timings:
+            image_bytes = await _read_raw_image(request)
+            if not image_bytes:
+                raise HTTPException(status_code=400, detail="Empty image")
+            result = await _cached_verify_liveness(response, multi_face, image_bytes=image_bytes)
+    return _liveness_response(result, response, (request.headers.get("accept") or "").lower(), timings)
+
+
+def _predict_many(image_crops: list[list[np.ndarray]]):
+    """
+    image_crops: per image, the crops returned by _crop_for_models().
+    Runs one batched forward per model (models concurrently) and returns one result per image.
+    """
+    predictions = np.zeros((len(image_crops), 3), dtype=np.float32)
+    metrics.observe_batch(len(image_crops))
+    with metrics.timed("inference"):
+        per_model = _models().ensemble.predict_many(image_crops)
+    for probs, _ms in per_model:  # (N,3) per model
+        predictions += probs.astype(np.float32)
+    return [_summarize_prediction(predictions[i : i + 1]) for i in range(len(image_crops))]
+
+
+# Near-duplicate skipping in /v1/batch-verify: a frame whose difference hash is within
+# BATCH_DEDUP_DISTANCE bits (of 64) of an already scheduled frame reuses that frame's
+# result instead of being detected and inferred again. A negative value disables it.
+BATCH_DEDUP_DISTANCE = int(os.getenv("BATCH_DEDUP_DISTANCE", "3"))
+
+
+def _batch_verify_pipeline(images: list[LivenessRequest]) -> dict:
+    results: list[dict | None] = [None] * len(images)
+
+    # Decode + crop every frame first, then infer all of them in one forward.
+    pending_index = []
+    pending_crops = []
+    fingerprints = []  # (index, dhash) of the inferred frames, appended once a frame is cropped
+    reused = {}  # frame index -> index of the inferred frame it reuses
     for i, req in enumerate(images):
         try:
-            image_bgr = decode_base64_image(req.image_base64)
+            image_bgr, reduction = _decode_base64(req.image_base64)
             if image_bgr is None:
-                results.append({"index": i, "error": "Invalid image"})
+                results[i] = {"index": i, "error": "Invalid image"}
                 continue
-            try:
-                bbox = predictor.get_bbox(image_bgr)
-            except Exception:
-                bbox = _fallback_center_bbox(image_bgr)
-            r = _predict_face_authenticity(image_bgr, bbox)
-            results.append({"index": i, "is_real": r["is_real"], "confidence": r["confidence"]})
+            fingerprint = None
+            if BATCH_DEDUP_DISTANCE >= 0:
+                fingerprint = dhash(image_bgr)
+                match = next(
+                    (j for j, h in fingerprints if hamming(fingerprint, h) <= BATCH_DEDUP_DISTANCE),
+                    None,
+                )
+                if match is not None:
+                    reused[i] = match
+                    continue
+            bbox, _found = _detect_bbox(image_bgr, reduction)
+            pending_crops.append(_crop_for_models(image_bgr, bbox))
+            pending_index.append(i)
+            if fingerprint is not None:
+                fingerprints.append((i, fingerprint))
         except Exception as e:
-            results.append({"index": i, "error": str(e)})
+            results[i] = {"index": i, "error": str(e)}
+
+    if pending_crops:
+        try:
+            for i, r in zip(pending_index, _predict_many(pending_crops)):
+                results[i] = {"index": i, "is_real": r["is_real"], "confidence": r["confidence"]}
+        except Exception as e:
+            for i in pending_index:
+                results[i] = {"index": i, "error": str(e)}
+
+    for i, j in reused.items():
+        source = results[j]
+        if "is_real" in source:
+            results[i] = {"index": i, "is_real": source["is_real"], "confidence": source["confidence"], "reused_from": j}
+        else:
+            results[i] = {"index": i, "error": source["error"], "reused_from": j}
 
     valid = [r for r in results if "is_real" in r]
     if valid:
@@ -289,35 +1040,307 @@ async def batch_verify(images: list[LivenessRequest]):
     else:
         avg_conf = 0.0
         all_real = False
-    return {"aggregate": {"is_real": all_real, "avg_confidence": avg_conf, "frames_analyzed": len(valid)}, "individual_results": results}
+    return {
+        "aggregate": {
+            "is_real": all_real,
+            "avg_confidence": avg_conf,
+            "frames_analyzed": len(valid),
+            "frames_inferred": len(pending_index),
+        },
+        "individual_results": results,
+    }
 
 
-def decode_base64_image(base64_string: str) -> np.ndarray | None:
+@app.post("/v1/batch-verify")
+async def batch_verify(images: list[LivenessRequest], http_request: Request, response: Response):
+    with _serving_models():
+        async with _diagnostics(http_request, response, "batch-verify"):
+            async with pipeline_executor.admit():
+                return await pipeline_executor.run(_batch_verify_pipeline, images)
+
+
+# Short clips (POST /v1/verify-video): frames are sampled at VIDEO_SAMPLE_FPS (by presentation
+# time, at most VIDEO_MAX_FRAMES from the first VIDEO_MAX_DURATION_S seconds), the face is tracked
+# across them and all sampled frames are scored in one batched forward. Clients may ask for a lower
+# rate / fewer frames (?sample_fps=, ?max_frames=), not more. The upload is decoded from a temporary
+# file in VIDEO_TMP_DIR (default: the system temp dir; /dev/shm keeps it in memory). Request bodies
+# are also capped by MAX_REQUEST_BYTES; frames by MAX_IMAGE_PIXELS, and sampled frames are
+# downscaled to DECODE_TARGET_SIDE as they are decoded (bboxes are reported in video pixels).
+MAX_VIDEO_BYTES = int(os.getenv("MAX_VIDEO_BYTES", str(16 * 1024 * 1024)))
+VIDEO_SAMPLE_FPS = float(os.getenv("VIDEO_SAMPLE_FPS", "5"))
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "20"))
+VIDEO_MAX_DURATION_S = float(os.getenv("VIDEO_MAX_DURATION_S", "10"))
+VIDEO_TMP_DIR = os.getenv("VIDEO_TMP_DIR") or None
+
+
+def _video_pipeline(video_bytes: bytes, sample_fps: float, max_frames: int) -> dict:
     """
-    Decode a base64 string to an OpenCV image.
+    Decode + sample -> track the face -> crop every frame -> one batched forward.
+    Returns the aggregated result with per-frame results under "frames".
+    """
+    with metrics.timed("decode"):
+        try:
+            frames, info = sample_frames(
+                video_bytes, sample_fps, max_frames, VIDEO_MAX_DURATION_S, MAX_IMAGE_PIXELS, VIDEO_TMP_DIR,
+                DECODE_TARGET_SIDE,
+            )
+        except VideoError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # Frames are downscaled by info["scale"]: keep the minimum face size in video pixels,
+    # report bboxes in video coordinates.
+    scale = info["scale"]
+    predictor = _models().predictor
+    tracker = FaceTracker(predictor, min_size=math.ceil(predictor.min_face_size / scale))
+    tracked = []
+    for _index, _time_ms, frame in frames:
+        with metrics.timed("detect"):
+            try:
+                bbox, found = tracker.update(frame)
+            except RuntimeError:
+                bbox, found = None, False
+        metrics.count_detection(found)
+        tracked.append((bbox, found))
+
+    image_crops = []
+    with metrics.timed("crop"):
+        for (_index, _time_ms, frame), (bbox, _found) in zip(frames, tracked):
+            # Frames before the face was first found use the center square.
+            image_crops.append(_models().ensemble.crop(frame, bbox if bbox is not None else center_square_bbox(frame)))
+    results = [_apply_real_threshold(r) for r in _predict_many(image_crops)]
+
+    per_frame = []
+    for (index, time_ms, frame), (bbox, found), r in zip(frames, tracked, results):
+        per_frame.append({
+            "index": index,
+            "time_ms": time_ms,
+            "is_real": bool(r["is_real"]),
+            "confidence": float(r["confidence"]),
+            "probabilities": r["probabilities"],
+            "bbox": [int(v * scale) for v in (bbox if bbox is not None else center_square_bbox(frame))],
+            "face_detected": found,
+        })
+
+    # Aggregate over the frames with a detected face (all frames if the face was never found),
+    # with the same decision rule as a single image.
+    counted = [f for f in per_frame if f["face_detected"]] or per_frame
+    mean = {k: sum(f["probabilities"][k] for f in counted) / len(counted) for k in ("fake", "real", "unknown")}
+    label = int(np.argmax([mean["fake"], mean["real"], mean["unknown"]]))
+    aggregate = _apply_real_threshold({"probabilities": mean, "label": label})
+    aggregate.update(
+        frames=per_frame,
+        frames_with_face=sum(f["face_detected"] for f in per_frame),
+        real_frames_ratio=sum(f["is_real"] for f in counted) / len(counted),
+        video=info,
+        tracking={"window_hits": tracker.window_hits, "full_scans": tracker.full_scans},
+    )
+    return aggregate
+
+
+async def _verify_video(video_bytes: bytes, sample_fps: float, max_frames: int) -> LivenessResponse:
+    try:
+        async with pipeline_executor.admit():
+            r = await pipeline_executor.run(_video_pipeline, video_bytes, sample_fps, max_frames)
+        frames = r["frames"]
+        return LivenessResponse(
+            is_real=bool(r["is_real"]),
+            confidence=float(r["confidence"]),
+            threshold=float(r["threshold"]),
+            message="Real face detected" if r["is_real"] else "Spoof detected",
+            details={
+                "bbox": frames[-1]["bbox"],
+                "probabilities": r["probabilities"],
+                "label": r["label"],
+                "model": _models().version,
+                "real_prob_threshold": float(r["threshold"]),
+                "batch_size": len(frames),
+                "frames_sampled": len(frames),
+                "frames_with_face": r["frames_with_face"],
+                "real_frames_ratio": r["real_frames_ratio"],
+                "video": r["video"],
+                "tracking": r["tracking"],
+                "frames": frames,
+            },
+        )
+    except (HTTPException, OverloadedError, ImageTooLargeError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
 
-    Args:
-        base64_string: Base64 encoded image
 
-    Returns:
-        OpenCV image (numpy array) or None if decoding fails
+@app.post("/v1/verify-video", response_model=LivenessResponse)
+async def verify_video(request: Request, response: Response, sample_fps: float | None = None, max_frames: int | None = None):
+    """
+    Short clip (MP4 / WebM) as the raw body (video/*, application/octet-stream) or a multipart
+    'file' part. Returns the temporally aggregated verdict with per-frame scores in details.frames.
+    """
+    sample_fps = min(sample_fps, VIDEO_SAMPLE_FPS) if sample_fps and sample_fps > 0 else VIDEO_SAMPLE_FPS
+    max_frames = min(max_frames, VIDEO_MAX_FRAMES) if max_frames and max_frames > 0 else VIDEO_MAX_FRAMES
+    with _serving_models():
+        async with _diagnostics(request, response, "verify-video") as timings:
+            video_bytes = await _read_raw_image(request, kind="video")
+            if not video_bytes:
+                raise HTTPException(status_code=400, detail="Empty video")
+            if len(video_bytes) > MAX_VIDEO_BYTES:
+                raise ImageTooLargeError(f"Video payload too large ({len(video_bytes)} bytes > {MAX_VIDEO_BYTES})")
+            if result_cache is None:
+                result = await _verify_video(video_bytes, sample_fps, max_frames)
+            else:
+                variant = f"video:{sample_fps}:{max_frames}"
+                # Hashing up to MAX_VIDEO_BYTES takes tens of ms: off the event loop, like _prepare_payload().
+                async with pipeline_executor.admit():
+                    key = await pipeline_executor.run(result_cache.key, video_bytes, variant)
+                result, status = await result_cache.get_or_compute(
+                    video_bytes, lambda: _verify_video(video_bytes, sample_fps, max_frames), variant=variant, key=key
+                )
+                response.headers["X-Cache"] = status
+    return _liveness_response(result, response, (request.headers.get("accept") or "").lower(), timings)
+
+
+# Streaming liveness (WebSocket /v1/stream-liveness): verdict once the mean of the last
+# STREAM_WINDOW frames (at least STREAM_MIN_FRAMES) passes REAL_PROB_THRESHOLD for real or
+# STREAM_FAKE_THRESHOLD for fake; otherwise after STREAM_MAX_FRAMES inferred frames.
+STREAM_WINDOW = int(os.getenv("STREAM_WINDOW", "5"))
+STREAM_MIN_FRAMES = int(os.getenv("STREAM_MIN_FRAMES", "3"))
+STREAM_MAX_FRAMES = int(os.getenv("STREAM_MAX_FRAMES", "30"))
+STREAM_FAKE_THRESHOLD = float(os.getenv("STREAM_FAKE_THRESHOLD", str(REAL_PROB_THRESHOLD)))
+
+
+def _stream_frame(session: StreamSession, frame) -> dict:
+    """
+    Decode -> detect -> crop -> infer one streamed frame (bytes or base64 text).
+    Frames without a detectable face reuse the session's last bbox.
+    """
+    if isinstance(frame, str):
+        image_bgr, reduction = _decode_base64(frame)
+    else:
+        image_bgr, reduction = _decode_image_bytes(frame)
+    if image_bgr is None:
+        return {"type": "error", "detail": "Invalid image data"}
+
+    last_bbox = [int(v // reduction) for v in session.last_bbox] if session.last_bbox is not None else None
+    bbox, face_found = _detect_bbox(image_bgr, reduction, fallback=last_bbox)
+
+    r = _apply_real_threshold(_predict_crops(_crop_for_models(image_bgr, bbox)))
+    original_bbox = _to_original_bbox(bbox, reduction)
+    session.add(r["probabilities"], original_bbox if face_found else None)
+    return {
+        "type": "frame",
+        "frame": session.frames_inferred,
+        "is_real": bool(r["is_real"]),
+        "confidence": float(r["confidence"]),
+        "probabilities": r["probabilities"],
+        "bbox": original_bbox,
+        "face_detected": face_found,
+        "window": session.window_probabilities(),
+    }
+
+
+@app.websocket("/v1/stream-liveness")
+async def stream_liveness(websocket: WebSocket):
+    """
+    Streaming liveness: the client sends frames (binary JPEG messages, or base64 text),
+    the server answers each inferred frame with a "frame" message and ends the session with
+    a "verdict" message as soon as the rolling window is confident. Frames arriving while
+    one is being inferred replace each other; only the newest is processed.
+    """
+    await websocket.accept()
+    if startup["state"] != "ready":
+        await websocket.close(code=1013, reason="Model is not ready")  # 1013: try again later
+        return
+    session = StreamSession(STREAM_WINDOW, STREAM_MIN_FRAMES, STREAM_MAX_FRAMES, REAL_PROB_THRESHOLD, STREAM_FAKE_THRESHOLD)
+    slot = LatestFrameSlot()
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                frame = message.get("bytes")
+                if frame is None:
+                    frame = message.get("text")
+                if frame:
+                    session.frames_received += 1
+                    slot.put(frame)
+        finally:
+            slot.close()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            frame = await slot.get()
+            if frame is None:
+                break
+            try:
+                # Pinned per frame, so a long session does not hold an old model set.
+                with registry.acquire():
+                    async with pipeline_executor.admit():
+                        out = await pipeline_executor.run(_stream_frame, session, frame)
+            except OverloadedError:
+                slot.dropped += 1
+                continue
+            except ImageTooLargeError as e:
+                out = {"type": "error", "detail": str(e)}
+            out["dropped"] = slot.dropped
+            await websocket.send_json(out)
+
+            verdict = session.verdict()
+            if verdict is not None:
+                await websocket.send_json({
+                    "type": "verdict",
+                    **verdict,
+                    "threshold": REAL_PROB_THRESHOLD,
+                    "frames_received": session.frames_received,
+                    "frames_analyzed": session.frames_inferred,
+                    "frames_dropped": slot.dropped,
+                })
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+
+def _base64_payload(base64_string: str) -> bytes | None:
+    """
+    Base64 (optionally a data URL) -> encoded image bytes, or None if it isn't valid base64.
     """
     try:
         # Remove data URL prefix if present
         if "," in base64_string:
-            base64_string = base64_string.split(",")[1]
+            base64_string = base64_string.split(",", 1)[1]
+        return base64.b64decode(base64_string)
+    except Exception as e:
+        print(f"Image decode error: {e}")
+        return None
 
-        # Decode base64
-        img_data = base64.b64decode(base64_string)
 
-        # Convert to numpy array
-        nparr = np.frombuffer(img_data, np.uint8)
+def _decode_base64(base64_string: str) -> tuple[np.ndarray | None, int]:
+    """
+    Base64 (optionally a data URL) -> (BGR image or None, reduction), see _decode_image_bytes().
+    Raises ImageTooLargeError when the image exceeds the configured limits.
+    """
+    img_data = _base64_payload(base64_string)
+    if not img_data:
+        return None, 1
+    return _decode_image_bytes(img_data)
 
-        # Decode image
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
-        return img
-    except Exception as e:
+def decode_base64_image(base64_string: str) -> np.ndarray | None:
+    """
+    Decode a base64 string to an OpenCV image.
+
+    Args:
+        base64_string: Base64 encoded image
+
+    Returns:
+        OpenCV image (numpy array, possibly decoded at reduced scale) or None if decoding fails
+    """
+    try:
+        return _decode_base64(base64_string)[0]
+    except ImageTooLargeError as e:
         print(f"Image decode error: {e}")
         return None
 
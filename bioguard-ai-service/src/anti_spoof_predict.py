@@ -2,54 +2,38 @@
 """
 Anti-spoof predictor using PyTorch .pth weights.
 This follows the structure of the reference code, but uses Haar cascade for bbox
-to avoid external caffe model dependencies.
+(src/detection.py) to avoid external caffe model dependencies.
 """
 
 from __future__ import annotations
 
 import os
-import cv2
 import torch
 import numpy as np
 import torch.nn.functional as F
 
+from src.detection import Detection
 from src.model_lib.MiniFASNet import MiniFASNetV1SE
-from src.data_io import transform as trans
+from src.input_buffer import InputBuffer
+from src.optimize import max_prob_diff, optimize_for_inference
 from src.utility import get_kernel, parse_model_name
 
 
-class Detection:
-    def __init__(self):
-        # Use OpenCV haarcascade (bundled with opencv) so the service is self-contained.
-        self.detector_confidence = 0.0
-        cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-        self.face_cascade = cv2.CascadeClassifier(cascade_path) if os.path.exists(cascade_path) else None
-
-    def get_bbox(self, img: np.ndarray):
-        """
-        Returns bbox in [x, y, w, h] (like reference code).
-        """
-        if self.face_cascade is None:
-            raise RuntimeError("Haar cascade not available")
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(60, 60))
-        if len(faces) == 0:
-            raise RuntimeError("No face detected")
-        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
-        return [int(x), int(y), int(w), int(h)]
-
-
 class AntiSpoofPredict(Detection):
     def __init__(self, device_id: int = 0):
         super().__init__()
         self.device = torch.device(f"cuda:{device_id}" if torch.cuda.is_available() else "cpu")
         self.model = None
         self.kernel_size = None
+        self.input_size = None
+        self.channels_last = False
+        self.inputs = None  # InputBuffer, created on first use for input_size / layout
 
     def load_model(self, model_path: str):
         model_name = os.path.basename(model_path)
         h_input, w_input, model_type, _ = parse_model_name(model_name)
         self.kernel_size = get_kernel(h_input, w_input)
+        self.input_size = (h_input, w_input)
 
         if model_type != "MiniFASNetV1SE":
             raise ValueError(f"Only MiniFASNetV1SE is supported by this service, got: {model_type}")
@@ -71,21 +55,78 @@ class AntiSpoofPredict(Detection):
         self.model.eval()
         return None
 
+    def optimize(self, jit: str = "trace", channels_last: bool = True, atol: float = 1e-4) -> float:
+        """
+        Swap in a fused (Conv+BN), optionally traced/compiled, channels-last copy of the model.
+        The optimized model is only kept if its probabilities match the original within `atol`.
+        Returns the measured max abs probability difference.
+        """
+        if self.model is None:
+            raise RuntimeError("Model not loaded. Call load_model(model_path) first.")
+
+        h_input, w_input = self.input_size
+        example = (torch.rand(4, 3, h_input, w_input) * 255).to(self.device)
+        optimized = optimize_for_inference(self.model, example, jit=jit, channels_last=channels_last)
+        diff = max_prob_diff(self.model, optimized, example, channels_last=channels_last)
+        if diff > atol:
+            raise RuntimeError(f"Optimized model output differs from original (max abs diff {diff:.2e} > {atol:.0e})")
+        self.model = optimized
+        self.channels_last = channels_last
+        self.inputs = None
+        return diff
+
+    def _to_input(self, crops):
+        """
+        Crops -> (N,C,H,W) float tensor (0..255) wrapping this thread's reusable input buffer.
+        """
+        if self.inputs is None:
+            h_input, w_input = self.input_size
+            self.inputs = InputBuffer(h_input, w_input, channels_last=self.channels_last)
+        img_tensor = torch.from_numpy(self.inputs.fill(crops))
+        if self.channels_last:
+            img_tensor = img_tensor.permute(0, 3, 1, 2)  # NHWC memory, channels_last strides
+        return img_tensor.to(self.device)
+
+    def _forward_probs(self, img_tensor):
+        if self.channels_last:
+            img_tensor = img_tensor.contiguous(memory_format=torch.channels_last)
+        with torch.inference_mode():
+            out = self.model.forward(img_tensor)
+            return F.softmax(out, dim=1).cpu().numpy()
+
     def predict(self, img_bgr_80: np.ndarray):
         """
         img_bgr_80: numpy array (H,W,C) in BGR order (OpenCV).
         Returns softmax probabilities shape (1,3)
         """
+        return self.predict_batch([img_bgr_80])
+
+    def predict_batch(self, crops):
+        """
+        crops: sequence of N numpy arrays (H,W,C) in BGR order, all the same size.
+        Returns softmax probabilities shape (N,3) from a single forward.
+        """
         if self.model is None:
             raise RuntimeError("Model not loaded. Call load_model(model_path) first.")
+        if len(crops) == 0:
+            return np.zeros((0, 3), dtype=np.float32)
 
-        test_transform = trans.Compose([trans.ToTensor()])
-        img_tensor = test_transform(img_bgr_80)  # float tensor CHW (0..255)
-        img_tensor = img_tensor.unsqueeze(0).to(self.device)
+        return self._forward_probs(self._to_input(crops))
 
-        with torch.no_grad():
-            out = self.model.forward(img_tensor)
-            probs = F.softmax(out, dim=1).cpu().numpy()
-        return probs
 
+class TorchScriptAntiSpoofPredict(AntiSpoofPredict):
+    """
+    PyTorch engine for a frozen TorchScript model, e.g. the INT8 variants written by
+    src/quantization.py. Quantized kernels run on CPU only.
+    """
 
+    def __init__(self, device_id: int = 0):
+        super().__init__(device_id=device_id)
+        self.device = torch.device("cpu")
+
+    def load_model(self, model_path: str):
+        h_input, w_input, _model_type, _ = parse_model_name(os.path.basename(model_path))
+        self.input_size = (h_input, w_input)
+        self.model = torch.jit.load(model_path, map_location=self.device)
+        self.model.eval()
+        return None
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Inference backend registry.
+
+Every backend exposes the AntiSpoofPredict interface (get_bbox, load_model,
+predict, predict_batch) so main.py can pick one per deployment via
+INFERENCE_BACKEND without caring which runtime executes the network.
+Only the torch backends import torch (when they are created), so an ONNX-only
+deployment runs with onnxruntime alone.
+
+Class mapping is the MiniFASNet one for all backends: 0=fake, 1=real, 2=unknown.
+"""
+
+from __future__ import annotations
+
+import os
+
+import numpy as np
+
+from src.detection import Detection
+from src.input_buffer import InputBuffer
+from src.utility import parse_model_name
+
+try:
+    import onnxruntime as ort
+
+    ONNX_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNX_AVAILABLE = False
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp_scores = np.exp(logits - np.max(logits, axis=1, keepdims=True))  # Numerical stability
+    return exp_scores / np.sum(exp_scores, axis=1, keepdims=True)
+
+
+class OnnxAntiSpoofPredict(Detection):
+    """
+    ONNX Runtime engine for a MiniFASNet graph exported by src/export_onnx.py
+    (input: float NCHW BGR 0..255, dynamic batch; output: logits).
+    """
+
+    intra_op_threads = 0  # 0 = onnxruntime default (all cores); set by ThreadPolicy.apply()
+
+    def __init__(self, device_id: int = 0):
+        super().__init__()
+        if not ONNX_AVAILABLE:
+            raise RuntimeError("onnxruntime is not installed")
+        providers = ["CPUExecutionProvider"]
+        if "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, ("CUDAExecutionProvider", {"device_id": device_id}))
+        self.providers = providers
+        self.session = None
+        self.input_name = None
+        self.input_size = None
+        self.inputs = None
+
+    def load_model(self, model_path: str):
+        h_input, w_input, _model_type, _ = parse_model_name(os.path.basename(model_path))
+        self.input_size = (h_input, w_input)
+        self.inputs = InputBuffer(h_input, w_input)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=self.providers)
+        self.input_name = self.session.get_inputs()[0].name
+        return None
+
+    def predict(self, img_bgr_80: np.ndarray):
+        """
+        img_bgr_80: numpy array (H,W,C) in BGR order (OpenCV).
+        Returns softmax probabilities shape (1,3)
+        """
+        return self.predict_batch([img_bgr_80])
+
+    def predict_batch(self, crops):
+        """
+        crops: sequence of N numpy arrays (H,W,C) in BGR order, all the same size.
+        Returns softmax probabilities shape (N,3) from a single run.
+        """
+        if self.session is None:
+            raise RuntimeError("Model not loaded. Call load_model(model_path) first.")
+        if len(crops) == 0:
+            return np.zeros((0, 3), dtype=np.float32)
+
+        logits = self.session.run(None, {self.input_name: self.inputs.fill(crops)})[0]
+        return _softmax(logits).astype(np.float32)
+
+
+def _torch_predictor(device_id: int = 0):
+    from src.anti_spoof_predict import AntiSpoofPredict  # imports torch
+
+    return AntiSpoofPredict(device_id=device_id)
+
+
+def _torchscript_predictor(device_id: int = 0):
+    from src.anti_spoof_predict import TorchScriptAntiSpoofPredict  # imports torch
+
+    return TorchScriptAntiSpoofPredict(device_id=device_id)
+
+
+# Backend name -> predictor factory (called with device_id).
+BACKENDS = {
+    "torch": _torch_predictor,
+    "torch-int8-dynamic": _torchscript_predictor,
+    "torch-int8-static": _torchscript_predictor,
+    "onnx": OnnxAntiSpoofPredict,
+}
+
+# Weight file suffix each backend loads (all derived from the same model name).
+BACKEND_EXTENSIONS = {
+    "torch": ".pth",
+    "torch-int8-dynamic": ".int8-dynamic.pt",
+    "torch-int8-static": ".int8-static.pt",
+    "onnx": ".onnx",
+}
+
+
+def resolve_model_path(backend: str, model_path: str) -> str:
+    """
+    Map a configured model path to the file the backend loads, e.g.
+    models/4_0_0_80x80_MiniFASNetV1SE.pth -> models/4_0_0_80x80_MiniFASNetV1SE.onnx for "onnx".
+    """
+    ext = BACKEND_EXTENSIONS[backend]
+    if model_path.endswith(ext):
+        return model_path
+    for known in sorted(BACKEND_EXTENSIONS.values(), key=len, reverse=True):
+        if model_path.endswith(known):
+            return model_path[: -len(known)] + ext
+    return os.path.splitext(model_path)[0] + ext
+
+
+def create_predictor(backend: str, model_path: str, device_id: int = 0):
+    """
+    Build and load a predictor for `backend` (one of BACKENDS).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend} (expected one of {sorted(BACKENDS)})")
+    path = resolve_model_path(backend, model_path)
+    if not os.path.exists(path):
+        hint = ""
+        if backend == "onnx":
+            hint = " (export it with: python -m src.export_onnx)"
+        elif backend.startswith("torch-int8-"):
+            hint = " (create it with: python -m src.quantization)"
+        raise FileNotFoundError(f"Model file not found for backend '{backend}': {path}{hint}")
+    predictor = BACKENDS[backend](device_id=device_id)
+    predictor.load_model(path)
+    return predictor
+
+
+def warmup(predictor, input_size: tuple[int, int], batch_sizes=(1,)) -> None:
+    """
+    Run predict_batch() once per batch size so allocator / kernel selection costs are paid up front.
+    """
+    h, w = input_size
+    for bs in batch_sizes:
+        predictor.predict_batch([np.zeros((h, w, 3), dtype=np.uint8)] * int(bs))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Dynamic micro-batching in front of AntiSpoofPredict.
+
+Concurrent requests submit single crops; a background thread collects them for
+up to `max_wait_ms` (or until `max_batch_size` crops are pending), runs one
+stacked forward and resolves every caller's future with its own row.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from src import metrics
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        """
+        predict_fn: callable taking a list of crops and returning an (N,3) array.
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # The worker thread does not survive fork(), so (re)start it per process.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, crop: np.ndarray) -> Future:
+        """
+        Queue one crop. The returned future resolves to (probs_row, batch_size),
+        where probs_row has shape (3,) and batch_size is the size of the forward
+        the crop was served in.
+        """
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((crop, fut))
+        return fut
+
+    def close(self) -> None:
+        """
+        Stop the worker thread once the crops queued so far are served.
+        """
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                self._queue.put(None)
+            self._thread = None
+
+    def _collect(self):
+        items = [self._queue.get()]
+        if items[0] is None:
+            return None
+        deadline = time.monotonic() + self.max_wait_s
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    items.append(self._queue.get_nowait())
+                else:
+                    items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            if items[-1] is None:
+                self._queue.put(items.pop())  # close() after these crops
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            if items is None:
+                return
+            crops = [crop for crop, _ in items]
+            metrics.observe_batch(len(crops))
+            try:
+                with metrics.timed("inference"):
+                    probs = self.predict_fn(crops)
+            except Exception as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+                continue
+            batch_size = len(items)
+            for i, (_, fut) in enumerate(items):
+                fut.set_result((probs[i], batch_size))
@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+"""
+Offline bulk scoring of image archives (e.g. re-scoring verification frames to audit thresholds).
+
+    python -m src.bulk_score /data/frames --output scores.csv
+    python -m src.bulk_score /data/frames --output scores.parquet --workers 15 --batch-size 128
+
+Same steps as the service (size-limited decode, largest face via Detection, one CropImage crop
+per model, AntiSpoofPredict, the REAL_PROB_THRESHOLD decision rule), run as a pipeline:
+- a directory walker in the main process hands out chunks of paths,
+- a process pool decodes, detects and crops (one process per core by default; detection is
+  the expensive step),
+- the main process scores the crops of many images in one batched forward per model.
+
+Results stream to CSV, JSONL or Parquet (--format, default from the output extension) in
+completion order as batches are scored. Rerunning the same command resumes: paths already in
+the output are skipped, and a row cut off by an interruption is dropped and scored again.
+Parquet output is a directory of part files; a part becomes visible when it is complete.
+
+Progress (images/s) is printed every --report-every seconds; the final summary (throughput,
+errors, mean per-stage time) can also be written as JSON (--stats-json).
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+import cv2
+import numpy as np
+
+from src.backends import OnnxAntiSpoofPredict, create_predictor, resolve_model_path, warmup
+from src.detection import Detection
+from src.ensemble import ModelEnsemble
+from src.generate_patches import CropImage
+from src.image_io import decode_image
+from src.model_registry import model_version
+from src.threading_policy import ThreadPolicy
+from src.utility import center_square_bbox
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    PARQUET_AVAILABLE = True
+except ImportError:
+    pa = pq = None
+    PARQUET_AVAILABLE = False
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+FORMATS = ("csv", "jsonl", "parquet")
+COLUMNS = [
+    "path", "is_real", "prob_real", "prob_fake", "prob_unknown", "label",
+    "face_detected", "bbox_x", "bbox_y", "bbox_w", "bbox_h", "model", "error",
+]
+STAGES = ("decode", "detect", "crop")
+
+
+def _default_model_paths() -> list[str]:
+    # Same variables as main.py.
+    default = os.getenv("MODEL_PATH", os.path.join(BASE_DIR, "models", "4_0_0_80x80_MiniFASNetV1SE.pth"))
+    return [p.strip() for p in os.getenv("MODEL_PATHS", default).split(",") if p.strip()]
+
+
+def walk_images(root: str):
+    """
+    Relative paths of the image files under root, depth first, in name order within a directory.
+    """
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        subdirs = []
+        for entry in entries:
+            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(rel_path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield rel_path
+        stack.extend(reversed(subdirs))
+
+
+# Pool worker state (one per process, set by _init_worker).
+_worker = {}
+
+
+def _init_worker(model_names, detect_max_side: int, target_side: int, max_pixels: int):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C is handled by the main process
+    cv2.setNumThreads(1)
+    detector = Detection()
+    detector.detect_max_side = detect_max_side
+    _worker.update(
+        detector=detector,
+        # Crop specs only (scale / input size from the model names); no predictors in the workers.
+        ensemble=ModelEnsemble(dict.fromkeys(model_names), CropImage()),
+        target_side=target_side,
+        max_pixels=max_pixels,
+    )
+
+
+def _prepare_chunk(root: str, paths: list[str]) -> list[dict]:
+    """
+    Decode -> detect -> crop for a chunk of paths (runs in a pool worker).
+    One record per path: crops (one per model), bbox in original image coordinates,
+    face_detected and per-stage seconds; or the error.
+    """
+    detector, ensemble = _worker["detector"], _worker["ensemble"]
+    records = []
+    for path in paths:
+        try:
+            t0 = time.perf_counter()
+            with open(os.path.join(root, path), "rb") as f:
+                data = f.read()
+            image, reduction = decode_image(data, 0, _worker["max_pixels"], _worker["target_side"])
+            if image is None:
+                raise ValueError("Invalid image data")
+            t1 = time.perf_counter()
+            try:
+                bbox, found = detector.get_bbox(image, reduction), True
+            except RuntimeError:
+                bbox, found = center_square_bbox(image), False
+            t2 = time.perf_counter()
+            crops = ensemble.crop(image, bbox)
+            t3 = time.perf_counter()
+            records.append({
+                "path": path,
+                "crops": crops,
+                "bbox": [int(v * reduction) for v in bbox],
+                "face_detected": found,
+                "seconds": (t1 - t0, t2 - t1, t3 - t2),
+            })
+        except Exception as e:
+            records.append({"path": path, "error": str(e)})
+    return records
+
+
+class Scorer:
+    """
+    Loaded models (main process); scores the crops of many images with one forward per model.
+    """
+
+    def __init__(self, model_paths, backend: str = "torch", optimize: bool = True, batch_size: int = 64):
+        self.paths = [resolve_model_path(backend, p) for p in model_paths]
+        predictors = {os.path.basename(p): create_predictor(backend, p, device_id=0) for p in self.paths}
+        for name, predictor in predictors.items():
+            if optimize and hasattr(predictor, "optimize"):
+                try:
+                    predictor.optimize()
+                except Exception as e:
+                    print(f"{name} optimization skipped: {e}")
+            warmup(predictor, predictor.input_size, sorted({1, batch_size}))
+        self.names = list(predictors)
+        self.ensemble = ModelEnsemble(predictors, CropImage())
+        self.version = model_version(backend, self.paths)
+
+    def score(self, image_crops: list[list[np.ndarray]]) -> np.ndarray:
+        """
+        image_crops: per image, one crop per model. Returns (N,3) mean probabilities (fake, real, unknown).
+        """
+        probs = np.zeros((len(image_crops), 3), dtype=np.float32)
+        for model_probs, _ms in self.ensemble.predict_many(image_crops):
+            probs += model_probs.astype(np.float32)
+        return probs / len(self.names)
+
+    def close(self):
+        self.ensemble.close()
+
+
+def _result_row(record: dict, probs, threshold: float, version: str) -> dict:
+    row = dict.fromkeys(COLUMNS)
+    row.update(path=record["path"], model=version, error=record.get("error"))
+    if probs is not None:
+        label = int(np.argmax(probs))
+        bbox = record["bbox"]
+        row.update(
+            # Same rule as main.py: label "real" and prob_real >= threshold.
+            is_real=bool(label == 1 and probs[1] >= threshold),
+            prob_real=float(probs[1]),
+            prob_fake=float(probs[0]),
+            prob_unknown=float(probs[2]),
+            label=label,
+            face_detected=record["face_detected"],
+            bbox_x=bbox[0], bbox_y=bbox[1], bbox_w=bbox[2], bbox_h=bbox[3],
+        )
+    return row
+
+
+def _drop_partial_line(path: str) -> None:
+    """
+    Truncate a text file after its last newline (removes a row cut off by an interruption).
+    """
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        pos = size
+        while pos > 0:
+            step = min(1 << 16, pos)
+            pos -= step
+            f.seek(pos)
+            end = f.read(step).rfind(b"\n")
+            if end >= 0:
+                f.truncate(pos + end + 1)
+                return
+        f.truncate(0)
+
+
+class CsvResultWriter:
+    def __init__(self, path: str):
+        self.done = set()
+        if os.path.exists(path):
+            _drop_partial_line(path)
+            with open(path, newline="") as f:
+                self.done = {row["path"] for row in csv.DictReader(f)}
+        self.file = open(path, "a", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=COLUMNS)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+    def write(self, rows: list[dict]) -> None:
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class JsonlResultWriter:
+    def __init__(self, path: str):
+        self.done = set()
+        if os.path.exists(path):
+            _drop_partial_line(path)
+            with open(path) as f:
+                self.done = {json.loads(line)["path"] for line in f if line.strip()}
+        self.file = open(path, "a")
+
+    def write(self, rows: list[dict]) -> None:
+        self.file.write("".join(json.dumps(row) + "\n" for row in rows))
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetResultWriter:
+    """
+    Directory of part-NNNNN.parquet files. A part is written under a .tmp name and renamed once it
+    holds rows_per_part rows (or on close), so an interrupted run only loses its unfinished part.
+    """
+
+    def __init__(self, path: str, rows_per_part: int = 20000):
+        if not PARQUET_AVAILABLE:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self.schema = pa.schema([
+            ("path", pa.string()), ("is_real", pa.bool_()),
+            ("prob_real", pa.float32()), ("prob_fake", pa.float32()), ("prob_unknown", pa.float32()),
+            ("label", pa.int8()), ("face_detected", pa.bool_()),
+            ("bbox_x", pa.int32()), ("bbox_y", pa.int32()), ("bbox_w", pa.int32()), ("bbox_h", pa.int32()),
+            ("model", pa.string()), ("error", pa.string()),
+        ])
+        os.makedirs(path, exist_ok=True)
+        self.done = set()
+        parts = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".parquet.tmp"):
+                os.remove(os.path.join(path, name))  # unfinished part of an interrupted run
+            elif name.startswith("part-") and name.endswith(".parquet"):
+                parts.append(name)
+                self.done.update(pq.read_table(os.path.join(path, name), columns=["path"]).column("path").to_pylist())
+        self.next_part = max((int(name[5:10]) for name in parts), default=-1) + 1
+        self.writer = None
+        self.part_rows = 0
+
+    def _part_path(self) -> str:
+        return os.path.join(self.path, f"part-{self.next_part:05d}.parquet")
+
+    def write(self, rows: list[dict]) -> None:
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self._part_path() + ".tmp", self.schema)
+        self.writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+        self.part_rows += len(rows)
+        if self.part_rows >= self.rows_per_part:
+            self._finish_part()
+
+    def _finish_part(self) -> None:
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.replace(self._part_path() + ".tmp", self._part_path())
+        self.writer, self.part_rows = None, 0
+        self.next_part += 1
+
+    def close(self) -> None:
+        self._finish_part()
+
+
+def open_writer(path: str, fmt: str):
+    if fmt == "csv":
+        return CsvResultWriter(path)
+    if fmt == "jsonl":
+        return JsonlResultWriter(path)
+    return ParquetResultWriter(path)
+
+
+def _output_format(path: str, fmt: str | None) -> str:
+    if fmt:
+        return fmt
+    ext = os.path.splitext(path.rstrip("/"))[1].lower().lstrip(".")
+    if ext in ("json", "ndjson"):
+        return "jsonl"
+    if ext not in FORMATS:
+        raise SystemExit(f"Cannot infer the output format from {path!r}; pass --format ({', '.join(FORMATS)})")
+    return ext
+
+
+def run(args) -> dict:
+    fmt = _output_format(args.output, args.format)
+    writer = open_writer(args.output, fmt)
+    skipped = 0
+
+    def pending_paths():
+        nonlocal skipped
+        for path in walk_images(args.root):
+            if path in writer.done:
+                skipped += 1
+            else:
+                yield path
+
+    model_names = [os.path.basename(resolve_model_path(args.backend, p)) for p in args.models]
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(model_names, args.detect_max_side, args.decode_target_side, args.max_pixels),
+    )
+    # Start the workers before torch sets up its thread pools in this process (fork safety).
+    pool.submit(int).result()
+
+    if args.backend == "torch":
+        import torch  # only the torch backend needs it
+
+        torch.set_num_threads(args.threads)
+    else:
+        OnnxAntiSpoofPredict.intra_op_threads = args.threads
+    scorer = Scorer(args.models, args.backend, optimize=not args.no_optimize, batch_size=args.batch_size)
+    print(
+        f"Scoring {args.root} -> {args.output} ({fmt}); model {scorer.version}, {args.workers} workers, "
+        f"batch {args.batch_size}, {len(writer.done)} already scored"
+    )
+
+    stats = {"scored": 0, "errors": 0, "faces": 0, "stage_s": dict.fromkeys(STAGES, 0.0), "inference_s": 0.0}
+    t_start = last_report = time.monotonic()
+    paths = pending_paths()
+    in_flight = set()
+    batch = []
+    stop = []
+
+    def request_stop(signum, _frame):
+        # Finish the current step and write what is scored; a second Ctrl-C aborts at once.
+        stop.append(signum)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    handlers = {signum: signal.signal(signum, request_stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+    def submit_next() -> bool:
+        chunk = list(islice(paths, args.chunk_size))
+        if chunk:
+            in_flight.add(pool.submit(_prepare_chunk, args.root, chunk))
+        return bool(chunk)
+
+    def flush_batch():
+        t0 = time.perf_counter()
+        probs = scorer.score([record["crops"] for record in batch])
+        stats["inference_s"] += time.perf_counter() - t0
+        writer.write([_result_row(record, p, args.threshold, scorer.version) for record, p in zip(batch, probs)])
+        stats["scored"] += len(batch)
+        stats["faces"] += sum(record["face_detected"] for record in batch)
+        batch.clear()
+
+    try:
+        # Two chunks per worker keep the pool busy while this process runs inference.
+        while len(in_flight) < 2 * args.workers and submit_next():
+            pass
+        while in_flight and not stop:
+            finished, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in finished:
+                in_flight.discard(future)
+                submit_next()
+                failed = []
+                for record in future.result():
+                    if "error" in record:
+                        failed.append(_result_row(record, None, args.threshold, scorer.version))
+                        continue
+                    for stage, seconds in zip(STAGES, record["seconds"]):
+                        stats["stage_s"][stage] += seconds
+                    batch.append(record)
+                    if len(batch) >= args.batch_size:
+                        flush_batch()
+                if failed:
+                    writer.write(failed)
+                    stats["errors"] += len(failed)
+            if args.report_every > 0 and time.monotonic() - last_report >= args.report_every:
+                last_report = time.monotonic()
+                done = stats["scored"] + stats["errors"]
+                print(f"{done} images, {done / (last_report - t_start):.1f} images/s, {stats['errors']} errors")
+        if batch:
+            flush_batch()
+        if stop:
+            # Images still in the pool are scored by the next run.
+            print("Interrupted; run the same command again to resume")
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        pool.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+        scorer.close()
+
+    elapsed = time.monotonic() - t_start
+    done = stats["scored"] + stats["errors"]
+    scored = max(1, stats["scored"])
+    return {
+        "root": args.root,
+        "output": args.output,
+        "format": fmt,
+        "model": scorer.version,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+        "images": done,
+        "scored": stats["scored"],
+        "errors": stats["errors"],
+        "skipped_already_scored": skipped,
+        "interrupted": bool(stop),
+        "face_detected_rate": stats["faces"] / scored,
+        "elapsed_s": round(elapsed, 3),
+        "images_per_s": round(done / elapsed, 2) if elapsed > 0 else 0.0,
+        "images_per_hour": round(done / elapsed * 3600) if elapsed > 0 else 0,
+        # Worker stages are summed over all workers (CPU time per image, not wall time).
+        "mean_ms": {
+            **{stage: round(seconds / scored * 1000, 3) for stage, seconds in stats["stage_s"].items()},
+            "inference": round(stats["inference_s"] / scored * 1000, 3),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="directory scanned recursively for images")
+    parser.add_argument("--output", required=True, help="CSV / JSONL file or Parquet directory; resumed if it exists")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the output extension")
+    parser.add_argument("--models", nargs="+", default=_default_model_paths(), help="default: MODEL_PATHS / MODEL_PATH")
+    parser.add_argument("--backend", choices=("torch", "onnx"), default=os.getenv("INFERENCE_BACKEND", "torch"))
+    parser.add_argument("--workers", type=int, default=ThreadPolicy().cpus, help="decode/detect processes (default: one per usable CPU)")
+    parser.add_argument("--threads", type=int, default=1, help="torch / onnxruntime threads for inference in the main process")
+    parser.add_argument("--batch-size", type=int, default=64, help="images per forward")
+    parser.add_argument("--chunk-size", type=int, default=16, help="paths per worker task")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("REAL_PROB_THRESHOLD", "0.8")))
+    parser.add_argument("--detect-max-side", type=int, default=int(os.getenv("DETECT_MAX_SIDE", "0")))
+    parser.add_argument("--decode-target-side", type=int, default=int(os.getenv("DECODE_TARGET_SIDE", "960")))
+    parser.add_argument("--max-pixels", type=int, default=int(os.getenv("MAX_IMAGE_PIXELS", "40000000")))
+    parser.add_argument("--no-optimize", action="store_true", help="skip the fused / traced model")
+    parser.add_argument("--report-every", type=float, default=10.0, help="progress interval in seconds (0 disables)")
+    parser.add_argument("--stats-json", help="write the run summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    summary = run(args)
+    print(json.dumps(summary, indent=2))
+    if args.stats_json:
+        with open(args.stats_json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 130 if summary["interrupted"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
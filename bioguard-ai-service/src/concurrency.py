@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded execution of CPU-bound request work (decode, detect, crop, infer).
+
+The event loop only awaits results; the work itself runs on a small dedicated
+thread pool. An admission limit caps how many requests may be running or queued
+at once so that overload turns into a fast rejection instead of growing latency.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from src import metrics, profiling
+
+
+class OverloadedError(RuntimeError):
+    """Raised when the admission limit is reached."""
+
+
+class BoundedExecutor:
+    def __init__(self, max_workers: int = 2, queue_depth: int = 32):
+        self.max_workers = max(1, int(max_workers))
+        self.queue_depth = max(0, int(queue_depth))
+        self.max_in_flight = self.max_workers + self.queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @asynccontextmanager
+    async def admit(self):
+        """
+        Reserve a request slot for the duration of the block.
+        Raises OverloadedError immediately when all slots are taken.
+        """
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                raise OverloadedError("Too many requests in flight")
+            self._in_flight += 1
+        metrics.in_flight.inc()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            metrics.in_flight.dec()
+
+    async def run(self, fn, *args, **kwargs):
+        # The call runs in the caller's context (request timings / profiling are context variables).
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        metrics.queued.inc()
+        return await loop.run_in_executor(self._executor, functools.partial(ctx.run, self._dequeue_and_call, fn, args, kwargs))
+
+    @staticmethod
+    def _dequeue_and_call(fn, args, kwargs):
+        metrics.queued.dec()
+        profile = profiling.current()
+        if profile is not None:
+            return profile.run(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
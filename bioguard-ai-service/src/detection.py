@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Face detection with the Haar cascade bundled with OpenCV (no torch import, so the
+ONNX backend can run without PyTorch installed).
+"""
+
+from __future__ import annotations
+
+import math
+import os
+
+import cv2
+import numpy as np
+
+
+class Detection:
+    def __init__(self):
+        # Use OpenCV haarcascade (bundled with opencv) so the service is self-contained.
+        self.detector_confidence = 0.0
+        cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        self.face_cascade = cv2.CascadeClassifier(cascade_path) if os.path.exists(cascade_path) else None
+        # When > 0, run the cascade on a copy downscaled so its longest side is at most this many pixels.
+        self.detect_max_side = 0
+        # Smallest face searched for, in uploaded-image pixels (see get_bbox(reduction=...)).
+        self.min_face_size = 60
+
+    def _detect_faces(self, img: np.ndarray, min_size: int):
+        """
+        Returns all cascade detections at least min_size pixels (of img) wide, as [x, y, w, h]
+        in img coordinates.
+        """
+        h, w = img.shape[:2]
+        scale = 1.0
+        if self.detect_max_side and max(h, w) > self.detect_max_side:
+            scale = self.detect_max_side / float(max(h, w))
+            small = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        min_size = max(1, int(round(min_size * scale)))
+        faces = self.face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_size, min_size))
+        if scale == 1.0:
+            return [[int(x), int(y), int(fw), int(fh)] for x, y, fw, fh in faces]
+
+        boxes = []
+        for x, y, fw, fh in faces:
+            x0, y0 = int(round(x / scale)), int(round(y / scale))
+            x1, y1 = min(w, int(round((x + fw) / scale))), min(h, int(round((y + fh) / scale)))
+            boxes.append([x0, y0, x1 - x0, y1 - y0])
+        return boxes
+
+    def get_bbox(self, img: np.ndarray, reduction: int = 1):
+        """
+        Returns bbox in [x, y, w, h] (like reference code).
+        reduction: img was decoded at 1/reduction scale (decode_image); the smallest face
+        searched for stays min_face_size pixels of the uploaded image.
+        """
+        if self.face_cascade is None:
+            raise RuntimeError("Haar cascade not available")
+        faces = self._detect_faces(img, math.ceil(self.min_face_size / reduction))
+        if len(faces) == 0:
+            raise RuntimeError("No face detected")
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        return [int(x), int(y), int(w), int(h)]
+
+    def get_bboxes(self, img: np.ndarray, min_size: int | None = None, max_faces: int = 0):
+        """
+        Returns every detected face as [x, y, w, h], largest first (possibly empty).
+        min_size: smallest face searched for, in img pixels (None = min_face_size); it is the
+        cascade's minSize, so it can be lower than the default. max_faces: keep at most this many (0 = all).
+        """
+        if self.face_cascade is None:
+            raise RuntimeError("Haar cascade not available")
+        faces = self._detect_faces(img, self.min_face_size if min_size is None else min_size)
+        faces.sort(key=lambda f: f[2] * f[3], reverse=True)
+        return faces[:max_faces] if max_faces > 0 else faces
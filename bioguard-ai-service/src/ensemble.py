@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-model anti-spoof ensemble.
+
+Each model declares its crop (scale + input size) through its file name, e.g.
+2.7_80x80_... and 4_0_0_80x80_.... For every image each distinct crop spec is
+computed once and shared by all models that need it, and the models run
+concurrently (torch / onnxruntime release the GIL during the forward), so the
+ensemble costs close to the slowest model rather than the sum of all of them.
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.utility import parse_model_name
+
+
+class ModelEnsemble:
+    def __init__(self, predictors: dict, cropper):
+        """
+        predictors: model file name -> loaded predictor (AntiSpoofPredict interface), in ensemble order.
+        cropper: CropImage instance.
+        """
+        self.predictors = predictors
+        self.cropper = cropper
+        self.names = list(predictors)
+        self.specs = {}
+        for name in self.names:
+            h_input, w_input, _model_type, scale = parse_model_name(name)
+            self.specs[name] = (scale, h_input, w_input)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.names)), thread_name_prefix="ensemble")
+
+    def __len__(self):
+        return len(self.names)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+    def crop(self, image_bgr: np.ndarray, bbox) -> list[np.ndarray]:
+        """
+        One crop per model (same order as self.names); identical specs share one crop.
+        """
+        return self.crop_many(image_bgr, [bbox])[0]
+
+    def crop_many(self, image_bgr: np.ndarray, bboxes) -> list[list[np.ndarray]]:
+        """
+        crop() for several faces of one image, all patches produced by one crop_batch call.
+        Returns one crop list per bbox (input for predict_many()).
+        """
+        specs = list(dict.fromkeys(self.specs[name] for name in self.names))
+        patches = self.cropper.crop_batch(
+            image_bgr,
+            [(bbox, scale, (w_input, h_input)) for bbox in bboxes for scale, h_input, w_input in specs],
+        )
+        face_crops = []
+        for i in range(len(bboxes)):
+            by_spec = dict(zip(specs, patches[i * len(specs) : (i + 1) * len(specs)]))
+            face_crops.append([by_spec[self.specs[name]] for name in self.names])
+        return face_crops
+
+    def _timed_predict_batch(self, name: str, crops: list[np.ndarray]):
+        t0 = time.perf_counter()
+        probs = self.predictors[name].predict_batch(crops)
+        return probs, (time.perf_counter() - t0) * 1000.0
+
+    def _run_models(self, crops_per_model: list[list[np.ndarray]]):
+        if len(self.names) == 1:
+            return [self._timed_predict_batch(self.names[0], crops_per_model[0])]
+        futures = [
+            self._pool.submit(self._timed_predict_batch, name, crops)
+            for name, crops in zip(self.names, crops_per_model)
+        ]
+        return [f.result() for f in futures]
+
+    def predict(self, crops: list[np.ndarray]):
+        """
+        crops: output of crop() for one image.
+        Returns [(probs (1,3), time_ms)] per model.
+        """
+        return self._run_models([[crop] for crop in crops])
+
+    def predict_many(self, image_crops: list[list[np.ndarray]]):
+        """
+        image_crops: crop() output for N images, or crop_many() output for N faces. Every model
+        runs one batched forward over all N (its crops grouped into one batch).
+        Returns [(probs (N,3), time_ms)] per model.
+        """
+        crops_per_model = [[crops[m] for crops in image_crops] for m in range(len(self.names))]
+        return self._run_models(crops_per_model)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Export a MiniFASNet .pth to ONNX (dynamic batch) and check backend parity.
+
+    python -m src.export_onnx models/4_0_0_80x80_MiniFASNetV1SE.pth
+    python -m src.export_onnx models/4_0_0_80x80_MiniFASNetV1SE.pth --crops-dir crops/
+
+The exported graph takes float NCHW BGR input in 0..255 (same as ToTensor() in
+this repo, no /255) and returns logits; softmax is applied by the backend.
+After export, the PyTorch and ONNX Runtime backends are run on the same crops
+and the command fails if their probabilities differ by more than --atol
+(tests/test_backends_parity.py runs the same comparison under pytest).
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import torch
+
+from src.anti_spoof_predict import AntiSpoofPredict
+from src.backends import OnnxAntiSpoofPredict, resolve_model_path
+from src.utility import load_crops, parse_model_name
+
+
+def export_onnx(pth_path: str, onnx_path: str | None = None, opset: int = 17) -> str:
+    onnx_path = onnx_path or resolve_model_path("onnx", pth_path)
+    h_input, w_input, _model_type, _ = parse_model_name(os.path.basename(pth_path))
+
+    predictor = AntiSpoofPredict(device_id=0)
+    predictor.device = torch.device("cpu")
+    predictor.load_model(pth_path)
+
+    dummy = torch.zeros(1, 3, h_input, w_input)
+    torch.onnx.export(
+        predictor.model,
+        (dummy,),
+        onnx_path,
+        dynamo=False,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+    return onnx_path
+
+
+def check_parity(pth_path: str, onnx_path: str, crops: list[np.ndarray], atol: float = 1e-4) -> dict:
+    """
+    Run both backends on the same crops (single and batched) and compare probabilities.
+    """
+    torch_predictor = AntiSpoofPredict(device_id=0)
+    torch_predictor.load_model(pth_path)
+    onnx_predictor = OnnxAntiSpoofPredict(device_id=0)
+    onnx_predictor.load_model(onnx_path)
+
+    torch_probs = torch_predictor.predict_batch(crops)
+    onnx_probs = onnx_predictor.predict_batch(crops)
+    onnx_single = np.concatenate([onnx_predictor.predict(c) for c in crops[:4]])
+
+    batch_diff = float(np.max(np.abs(torch_probs - onnx_probs)))
+    single_diff = float(np.max(np.abs(torch_probs[: len(onnx_single)] - onnx_single)))
+    label_agreement = float(np.mean(np.argmax(torch_probs, axis=1) == np.argmax(onnx_probs, axis=1)))
+    return {
+        "crops": len(crops),
+        "max_abs_diff": max(batch_diff, single_diff),
+        "label_agreement": label_agreement,
+        "ok": max(batch_diff, single_diff) <= atol and label_agreement == 1.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export MiniFASNet .pth to ONNX and check parity")
+    parser.add_argument("pth_path")
+    parser.add_argument("--output", help="ONNX output path (default: next to the .pth)")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--crops-dir", help="folder of face crops (CropImage output) for the parity check")
+    parser.add_argument("--atol", type=float, default=1e-4)
+    parser.add_argument("--skip-check", action="store_true")
+    args = parser.parse_args(argv)
+
+    onnx_path = export_onnx(args.pth_path, args.output, args.opset)
+    print(f"Exported: {onnx_path}")
+    if args.skip_check:
+        return 0
+
+    h_input, w_input, _model_type, _ = parse_model_name(os.path.basename(args.pth_path))
+    report = check_parity(args.pth_path, onnx_path, load_crops(args.crops_dir, (h_input, w_input)), args.atol)
+    print(
+        f"Parity on {report['crops']} crops: max_abs_diff={report['max_abs_diff']:.2e} "
+        f"label_agreement={report['label_agreement']:.3f} -> {'OK' if report['ok'] else 'MISMATCH'}"
+    )
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
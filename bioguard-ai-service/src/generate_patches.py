@@ -2,6 +2,11 @@
 """
 Create patch from original input image by using bbox coordinate
 Ported from the reference implementation.
+
+crop_batch() produces several patches of one image at once: all boxes are
+computed in one vectorized step (same clamping as _get_new_box) and each patch is
+resized from a view of its box straight into a slot of a preallocated output
+batch, without intermediate arrays.
 """
 
 import cv2
@@ -40,6 +45,78 @@ class CropImage:
 
         return int(left_top_x), int(left_top_y), int(right_bottom_x), int(right_bottom_y)
 
+    @staticmethod
+    def _get_new_boxes(src_w, src_h, bboxes, scales):
+        """
+        Vectorized _get_new_box: bboxes (N,4) [x, y, w, h], scales (N,). Returns (N,4) int64
+        [left, top, right, bottom] (inclusive), identical to calling _get_new_box per row.
+        x and y are handled as the two columns of (N,2) arrays.
+        """
+        boxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        xy, wh = boxes[:, :2], boxes[:, 2:]
+        size = np.array([src_w, src_h], dtype=np.float64)
+        limits = (size - 1) / wh
+        scale = np.minimum(limits[:, 1], np.minimum(limits[:, 0], scales))[:, None]
+        center = wh / 2 + xy
+        half = wh * scale / 2
+        left_top = center - half
+        right_bottom = center + half
+
+        # Same branches as _get_new_box, as exact arithmetic (min/max, 0/1 masks).
+        right_bottom -= np.minimum(left_top, 0.0)
+        np.maximum(left_top, 0.0, out=left_top)
+        left_top -= (right_bottom > size - 1) * (right_bottom - size + 1)
+        np.minimum(right_bottom, size - 1, out=right_bottom)
+
+        return np.trunc(np.concatenate([left_top, right_bottom], axis=1)).astype(np.int64)
+
+    # Below this many boxes the per-box Python math is cheaper than the NumPy call overhead.
+    VECTORIZE_MIN_BOXES = 8
+
+    def crop_batch(self, org_img, specs, out=None):
+        """
+        specs: sequence of (bbox, scale, (out_w, out_h)); scale None resizes the whole image
+        (crop=False). out: optional uint8 array (N, out_h, out_w, C) to write into when every
+        spec has the same output size; otherwise one batch per output size is allocated.
+        Returns the N patches in spec order (views into the output batches), each identical to
+        crop(org_img, bbox, scale, out_w, out_h, crop=scale is not None).
+        """
+        src_h, src_w = org_img.shape[:2]
+        specs = list(specs)
+        cropped = [i for i, spec in enumerate(specs) if spec[1] is not None]
+        if len(cropped) >= self.VECTORIZE_MIN_BOXES:
+            computed = self._get_new_boxes(src_w, src_h, [specs[i][0] for i in cropped], [specs[i][1] for i in cropped])
+            boxes = dict(zip(cropped, computed.tolist()))
+        else:
+            boxes = {i: self._get_new_box(src_w, src_h, specs[i][0], specs[i][1]) for i in cropped}
+
+        sizes = [tuple(spec[2]) for spec in specs]
+        slots = {}
+        for size in sizes:
+            slots[size] = slots.get(size, 0) + 1
+        if out is not None and len(slots) == 1 and out.shape[:3] == (len(specs), sizes[0][1], sizes[0][0]):
+            batches = {sizes[0]: out}
+        else:
+            batches = {
+                size: np.empty((count, size[1], size[0]) + org_img.shape[2:], dtype=org_img.dtype)
+                for size, count in slots.items()
+            }
+        filled = dict.fromkeys(slots, 0)
+
+        patches = []
+        for i, size in enumerate(sizes):
+            slot = batches[size][filled[size]]
+            filled[size] += 1
+            box = boxes.get(i)
+            if box is not None:
+                left, top, right, bottom = box
+                roi = org_img[top : bottom + 1, left : right + 1]  # view, no copy
+            else:
+                roi = org_img
+            cv2.resize(roi, size, dst=slot)
+            patches.append(slot)
+        return patches
+
     def crop(self, org_img, bbox, scale, out_w, out_h, crop=True):
         if not crop:
             dst_img = cv2.resize(org_img, (out_w, out_h))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Size-aware, memory-bounded image decoding.
+
+The model only consumes an 80x80 crop, so decoding a 12-MP JPEG at native
+resolution (36 MB of BGR pixels) is wasted work. decode_image():
+- rejects payloads above max_bytes before touching the decoder
+- reads only the header (PIL) to get the size, rejects images above max_pixels (and,
+  when max_pixels is set, images whose header can't be read: their size is unknown)
+- decodes large JPEGs directly at 1/2, 1/4 or 1/8 scale (libjpeg DCT scaling via
+  cv2.IMREAD_REDUCED_COLOR_*) while keeping the longest side >= target_side
+"""
+
+from __future__ import annotations
+
+import io
+import warnings
+
+import cv2
+import numpy as np
+from PIL import Image
+
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class ImageTooLargeError(ValueError):
+    """Payload or pixel count exceeds the configured limit."""
+
+
+def read_image_size(data) -> tuple[int, int, str | None] | None:
+    """
+    (width, height, format) from the image header only, or None if unrecognized.
+    Raises ImageTooLargeError above PIL's decompression bomb limit (2x Image.MAX_IMAGE_PIXELS).
+    """
+    try:
+        with warnings.catch_warnings():
+            # Below the hard limit PIL only warns; decode_image() applies its own max_pixels.
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(data)) as img:
+                return img.size[0], img.size[1], img.format
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(f"Image too large ({e})") from e
+    except Exception:
+        return None
+
+
+def choose_reduction(width: int, height: int, target_side: int) -> int:
+    """
+    Largest JPEG reduction factor (1, 2, 4, 8) that keeps the longest side >= target_side.
+    """
+    if target_side <= 0:
+        return 1
+    longest = max(width, height)
+    for factor in (8, 4, 2):
+        if longest // factor >= target_side:
+            return factor
+    return 1
+
+
+def decode_image(data, max_bytes: int = 0, max_pixels: int = 0, target_side: int = 0):
+    """
+    data: encoded image (bytes, bytearray or memoryview; not copied).
+    Returns (BGR image, reduction factor) or (None, 1) if the data can't be decoded, or if
+    max_pixels is set and the header can't be read (no unbounded full-resolution decode).
+    Coordinates in the decoded image map back to the original by multiplying with the factor.
+    Raises ImageTooLargeError when a limit is exceeded (0 disables a limit).
+    """
+    if max_bytes and len(data) > max_bytes:
+        raise ImageTooLargeError(f"Image payload too large ({len(data)} bytes > {max_bytes})")
+
+    header = read_image_size(data)
+    if header is None and max_pixels:
+        return None, 1
+    reduction = 1
+    if header is not None:
+        width, height, fmt = header
+        if max_pixels and width * height > max_pixels:
+            raise ImageTooLargeError(f"Image too large ({width}x{height} > {max_pixels} pixels)")
+        if fmt in ("JPEG", "MPO"):
+            reduction = choose_reduction(width, height, target_side)
+
+    buf = np.frombuffer(data, np.uint8)
+    img = cv2.imdecode(buf, _REDUCED_FLAGS[reduction])
+    if img is None and header is not None:
+        # Formats OpenCV can't read but PIL can (size limits were already checked above).
+        try:
+            with Image.open(io.BytesIO(data)) as pil_img:
+                img = cv2.cvtColor(np.asarray(pil_img.convert("RGB")), cv2.COLOR_RGB2BGR)
+            reduction = 1
+        except Exception:
+            img = None
+    return img, reduction
+
+
+def dhash(img_bgr: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Difference hash of a decoded image: sign of horizontal gradients on a
+    (hash_size+1) x hash_size grayscale thumbnail, packed into an int.
+    Near-identical frames differ in only a few bits (see hamming()).
+    """
+    small = cv2.resize(img_bgr, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Reusable per-thread model input buffers.
+
+Building a model input used to take np.stack + transpose + ascontiguousarray +
+.float() (or a fresh ToTensor transform per crop): several copies of every crop.
+InputBuffer keeps one float32 batch array per thread, grown to the largest batch
+that thread has seen, and converts each uint8 HWC crop straight into its row
+(NHWC: one casting copy; NCHW: cv2.split into reusable uint8 planes, then
+contiguous casting copies, faster than a strided transposing copy). The model
+input wraps that array without copying (torch.from_numpy / the array itself for
+onnxruntime), so steady-state preprocessing allocates nothing proportional to
+the batch.
+
+Layout is NCHW, or NHWC in memory for channels-last models; the NCHW view of an
+NHWC buffer already has the channels_last strides those models expect.
+
+A filled view is valid until the same thread fills the buffer again.
+"""
+
+from __future__ import annotations
+
+import threading
+
+import cv2
+import numpy as np
+
+
+class InputBuffer:
+    def __init__(self, height: int, width: int, channels: int = 3, channels_last: bool = False):
+        self.height = height
+        self.width = width
+        self.channels = channels
+        self.channels_last = channels_last
+        self._local = threading.local()
+
+    def _rows(self, n: int) -> np.ndarray:
+        array = getattr(self._local, "array", None)
+        if array is None or array.shape[0] < n:
+            capacity = max(n, 2 * array.shape[0] if array is not None else n)
+            if self.channels_last:
+                shape = (capacity, self.height, self.width, self.channels)
+            else:
+                shape = (capacity, self.channels, self.height, self.width)
+            array = np.empty(shape, dtype=np.float32)
+            self._local.array = array
+        return array[:n]
+
+    def _planes(self) -> list[np.ndarray]:
+        planes = getattr(self._local, "planes", None)
+        if planes is None:
+            planes = list(np.empty((self.channels, self.height, self.width), dtype=np.uint8))
+            self._local.planes = planes
+        return planes
+
+    def fill(self, crops) -> np.ndarray:
+        """
+        crops: N uint8 arrays (H,W,C), BGR as OpenCV returns them.
+        Returns this thread's (N,C,H,W) float32 buffer view (N,H,W,C when channels_last), values 0..255.
+        """
+        rows = self._rows(len(crops))
+        planes = None if self.channels_last else self._planes()
+        expected = (self.height, self.width, self.channels)
+        for row, crop in zip(rows, crops):
+            if crop.shape != expected:
+                raise ValueError(f"Crop shape {crop.shape} does not match model input {expected}")
+            if planes is None:
+                np.copyto(row, crop)
+            else:
+                cv2.split(crop, planes)
+                for channel, plane in zip(row, planes):
+                    np.copyto(channel, plane)
+        return rows
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus metrics for the request pipeline.
+
+- bioguard_stage_seconds{stage}: decode, detect, crop, inference, serialize
+- bioguard_batch_size: rows per model forward
+- bioguard_in_flight_requests / bioguard_queued_tasks: admitted requests, and pipeline
+  tasks waiting for an executor thread
+- bioguard_face_detection_total{result}: detected vs fallback (center bbox / last bbox)
+- bioguard_results_total{label}: model results by argmax label
+
+Multi-worker: set PROMETHEUS_MULTIPROC_DIR (an empty, writable directory) before the
+server starts; every process then writes its samples to mmapped files there and
+/metrics aggregates all workers (gunicorn.conf.py clears the directory on start and
+marks exited workers dead).
+
+prometheus_client is optional: without it every metric is a no-op and /metrics returns 404.
+Label children are bound once at import, so recording is a single observe()/inc().
+
+Per-request stage timings: after start_request_timings(), timed() stages of that request
+(including work it runs on the pipeline executor, which copies the context) are also summed
+into a dict returned by request_timings().
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+STAGES = ("decode", "detect", "crop", "inference", "serialize")
+LABELS = ("fake", "real", "unknown")  # index = model label
+
+# 0.5 ms .. 2.5 s
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir"))
+
+
+if PROMETHEUS_AVAILABLE:
+    stage_seconds = Histogram("bioguard_stage_seconds", "Pipeline stage latency", ["stage"], buckets=STAGE_BUCKETS)
+    batch_size = Histogram("bioguard_batch_size", "Rows per model forward", buckets=BATCH_BUCKETS)
+    in_flight = Gauge("bioguard_in_flight_requests", "Requests admitted to the pipeline", multiprocess_mode="livesum")
+    queued = Gauge("bioguard_queued_tasks", "Pipeline tasks waiting for an executor thread", multiprocess_mode="livesum")
+    face_detection = Counter("bioguard_face_detection_total", "Face detection outcomes", ["result"])
+    results = Counter("bioguard_results_total", "Model results by label", ["label"])
+else:
+    stage_seconds = batch_size = in_flight = queued = face_detection = results = _NoopMetric()
+
+_stage = {name: stage_seconds.labels(name) for name in STAGES}
+_request_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+_detection = {name: face_detection.labels(name) for name in ("detected", "fallback")}
+_results = [results.labels(name) for name in LABELS]
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    _stage[stage].observe(seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        _stage[stage].observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def start_request_timings():
+    """
+    Start collecting stage timings for the current request; returns a token for stop_request_timings().
+    """
+    return _request_timings.set({})
+
+
+def request_timings() -> dict | None:
+    """
+    Stage -> seconds collected so far for the current request, or None if not collecting.
+    """
+    return _request_timings.get()
+
+
+def add_request_timing(stage: str, seconds: float) -> None:
+    """
+    Attribute time to a stage of the current request only (no histogram sample).
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def stop_request_timings(token) -> None:
+    _request_timings.reset(token)
+
+
+def observe_batch(size: int) -> None:
+    batch_size.observe(size)
+
+
+def count_detection(found: bool) -> None:
+    _detection["detected" if found else "fallback"].inc()
+
+
+def count_result(label: int) -> None:
+    if 0 <= label < len(_results):
+        _results[label].inc()
+
+
+def render() -> tuple[bytes, str]:
+    """
+    (body, content type) of the Prometheus text exposition for this process,
+    or for all workers in multiprocess mode.
+    """
+    if not PROMETHEUS_AVAILABLE:
+        raise RuntimeError("prometheus_client is not installed")
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    if PROMETHEUS_AVAILABLE and multiprocess_enabled():
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Versioned model sets with hot swap, drain and rollback.
+
+A ModelSet is everything one model configuration serves with: the loaded predictors
+(the first one also does face detection), their ModelEnsemble and micro-batchers, and
+a version id derived from the backend and the weight files' content (so retrained
+weights under the same file name get a new version).
+
+ModelRegistry keeps the active set and the previous one:
+- load() builds a new set off the event loop (the caller's build function loads,
+  optimizes, warms up and checks it) while the active set keeps serving, then swaps
+  it in; requests admitted from then on use the new set.
+- Requests pin the set they started on (acquire()), so in-flight requests finish on
+  the old set. A set pushed out of the previous slot is closed once it has drained.
+- rollback() swaps the previous set back in without reloading.
+
+Swaps happen on the event loop; pipeline threads read the pinned set through a
+ContextVar (copied into executor calls by BoundedExecutor).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from src.ensemble import ModelEnsemble
+
+
+def model_version(backend: str, paths) -> str:
+    """
+    "<file>[+<file>...]@<hash>" where hash covers the backend and the files' content.
+    """
+    digest = hashlib.blake2b(backend.encode(), digest_size=4)
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return "+".join(os.path.basename(p) for p in paths) + "@" + digest.hexdigest()
+
+
+class ModelSet:
+    def __init__(self, backend: str, paths, predictors: dict, cropper, batcher_factory=None):
+        """
+        predictors: model file name -> loaded predictor, in ensemble order (the first one detects faces).
+        batcher_factory: optional callable(predict_batch_fn) -> MicroBatcher.
+        """
+        self.backend = backend
+        self.paths = list(paths)
+        self.names = list(predictors)
+        self.predictors = predictors
+        self.predictor = predictors[self.names[0]]
+        self.ensemble = ModelEnsemble(predictors, cropper)
+        self.batchers = {
+            name: batcher_factory(model_predictor.predict_batch) for name, model_predictor in predictors.items()
+        } if batcher_factory is not None else {}
+        self.version = model_version(backend, self.paths)
+        self.loaded_at = time.time()
+        self.in_flight = 0
+
+    def close(self) -> None:
+        self.ensemble.close()
+        for batcher in self.batchers.values():
+            batcher.close()
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "backend": self.backend,
+            "models": self.names,
+            "paths": self.paths,
+            "loaded_at": self.loaded_at,
+            "in_flight": self.in_flight,
+        }
+
+
+class ModelRegistry:
+    def __init__(self, drain_timeout_s: float = 30.0):
+        self.drain_timeout_s = drain_timeout_s
+        self.active: ModelSet | None = None
+        self.previous: ModelSet | None = None
+        self.state = "idle"  # idle | loading | failed (last load)
+        self.error = None
+        self.history = deque(maxlen=20)
+        self._current: ContextVar[ModelSet | None] = ContextVar("model_set", default=None)
+        self._lock = asyncio.Lock()
+        self._draining = set()
+
+    def current(self) -> ModelSet | None:
+        """
+        The set pinned by the current request, else the active one.
+        """
+        return self._current.get() or self.active
+
+    @contextmanager
+    def acquire(self):
+        """
+        Pin the active set for the duration of a request (event loop only).
+        """
+        models = self.active
+        if models is None:
+            raise RuntimeError("No model loaded")
+        models.in_flight += 1
+        token = self._current.set(models)
+        try:
+            yield models
+        finally:
+            self._current.reset(token)
+            models.in_flight -= 1
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def activate(self, models: ModelSet, action: str = "activate") -> None:
+        """
+        Make `models` the active set; the old active one becomes the rollback target.
+        """
+        retired = self.previous
+        self.previous, self.active = self.active, models
+        self.history.append({"time": time.time(), "action": action, "version": models.version})
+        print(f"Model {action}: {models.version}" + (f" (previous {self.previous.version})" if self.previous else ""))
+        if retired is not None and retired is not models and retired is not self.previous:
+            self._draining.add(asyncio.ensure_future(self._close_when_drained(retired)))
+
+    async def load(self, build, paths) -> ModelSet:
+        """
+        build(paths) -> ready ModelSet, run in a thread. Loading the active version again
+        is a no-op; loading the previous version is a rollback.
+        """
+        async with self._lock:
+            self.state, self.error = "loading", None
+            try:
+                models = await asyncio.to_thread(build, paths)
+            except Exception as e:
+                self.state, self.error = "failed", str(e)
+                raise
+            self.state = "idle"
+            if self.active is not None and models.version == self.active.version:
+                models.close()
+                return self.active
+            if self.previous is not None and models.version == self.previous.version:
+                models.close()
+                self.activate(self.previous, "rollback")
+                return self.active
+            self.activate(models, "load")
+            return models
+
+    async def rollback(self) -> ModelSet:
+        async with self._lock:
+            if self.previous is None:
+                raise RuntimeError("No previous model version to roll back to")
+            self.activate(self.previous, "rollback")
+            return self.active
+
+    async def _close_when_drained(self, models: ModelSet) -> None:
+        deadline = time.monotonic() + self.drain_timeout_s
+        while models.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if models.in_flight:
+            print(f"Model {models.version} still has {models.in_flight} requests after {self.drain_timeout_s}s, closing")
+        models.close()
+        self._draining.discard(asyncio.current_task())
+
+    def info(self) -> dict:
+        return {
+            "active": self.active.info() if self.active is not None else None,
+            "previous": self.previous.info() if self.previous is not None else None,
+            "state": self.state,
+            "error": self.error,
+            "history": list(self.history),
+        }
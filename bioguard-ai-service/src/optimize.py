@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Load-time graph optimization for MiniFASNet models.
+
+- fold every BatchNorm into the preceding Conv2d/Linear (Conv_block, Linear_block, SEModule, embedding)
+- optionally trace + freeze to TorchScript, or wrap with torch.compile when available
+- channels-last memory format
+
+(Warmup forwards for the served batch sizes: src.backends.warmup, shared with the ONNX backend.)
+
+TorchScript scripting is not offered: Depth_Wise.forward defines `short_cut`
+only on the residual branch, which the script compiler rejects. Tracing records
+the (fixed per module) branch that is actually taken, so it is equivalent here.
+
+Note for preloaded multi-worker serving: these steps run forwards, so they must
+happen in each worker after fork (see the lifespan hook in main.py). Running
+parallel torch ops in the parent before fork can deadlock OpenMP in the children.
+"""
+
+from __future__ import annotations
+
+import copy
+
+import torch
+import torch.nn.functional as F
+from torch.nn import Identity, Module
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
+
+from src.model_lib.MiniFASNet import Conv_block, Linear_block, MiniFASNet, SEModule
+
+JIT_MODES = ("trace", "compile", "none")
+
+
+def fuse_conv_bn(model: Module) -> Module:
+    """
+    Fold BatchNorm layers into the preceding conv/linear, in place. Model must be in eval mode.
+    """
+    for module in list(model.modules()):
+        if isinstance(module, (Conv_block, Linear_block)):
+            module.conv = fuse_conv_bn_eval(module.conv, module.bn)
+            module.bn = Identity()
+        elif isinstance(module, SEModule):
+            module.fc1 = fuse_conv_bn_eval(module.fc1, module.bn1)
+            module.bn1 = Identity()
+            module.fc2 = fuse_conv_bn_eval(module.fc2, module.bn2)
+            module.bn2 = Identity()
+        elif isinstance(module, MiniFASNet) and module.embedding_size != 512:
+            # forward() only applies self.linear when embedding_size != 512
+            module.linear = fuse_linear_bn_eval(module.linear, module.bn)
+            module.bn = Identity()
+    return model
+
+
+def optimize_for_inference(model: Module, example: torch.Tensor, jit: str = "trace", channels_last: bool = True) -> Module:
+    """
+    Returns an optimized copy of `model`; the original is left untouched.
+    """
+    if jit not in JIT_MODES:
+        raise ValueError(f"Unknown jit mode: {jit} (expected one of {JIT_MODES})")
+
+    model = fuse_conv_bn(copy.deepcopy(model).eval())
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        example = example.contiguous(memory_format=torch.channels_last)
+
+    if jit == "trace":
+        with torch.no_grad():
+            model = torch.jit.freeze(torch.jit.trace(model, example).eval())
+    elif jit == "compile" and hasattr(torch, "compile"):
+        model = torch.compile(model)
+    return model
+
+
+def max_prob_diff(ref_model: Module, opt_model: Module, batch: torch.Tensor, channels_last: bool = True) -> float:
+    """
+    Largest absolute difference of softmax outputs between two models on the same batch.
+    """
+    with torch.inference_mode():
+        ref = F.softmax(ref_model(batch), dim=1)
+        opt_in = batch.contiguous(memory_format=torch.channels_last) if channels_last else batch
+        opt = F.softmax(opt_model(opt_in), dim=1)
+    return float((ref - opt).abs().max())
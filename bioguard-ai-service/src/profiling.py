@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+On-demand profiling of single requests.
+
+A request is profiled when it carries a valid `X-Profile-Token` header, or when it
+is picked by random sampling (sample_rate); both are capped at max_per_minute per
+worker. Without a configured token nothing is ever profiled.
+
+The request's CPU-bound work runs on the pipeline executor, so the profiler wraps
+each executor call of a profiled request (BoundedExecutor checks current()) rather
+than the event loop. Every call's profile is merged and written to `directory`:
+an HTML report with pyinstrument (sampling profiler, optional dependency),
+otherwise a cProfile .prof file (open with pstats / snakeviz).
+"""
+
+from __future__ import annotations
+
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.session import Session
+
+    PYINSTRUMENT_AVAILABLE = True
+except ImportError:
+    Profiler = None
+    Session = None
+    PYINSTRUMENT_AVAILABLE = False
+
+_current: ContextVar["RequestProfile | None"] = ContextVar("request_profile", default=None)
+
+
+def current() -> "RequestProfile | None":
+    return _current.get()
+
+
+class RequestProfile:
+    def __init__(self, name: str, interval_s: float = 0.0005):
+        self.name = name
+        self.interval_s = interval_s
+        self._parts = []
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Call fn under the profiler (in the calling thread) and keep its profile.
+        """
+        if PYINSTRUMENT_AVAILABLE:
+            profiler = Profiler(interval=self.interval_s, async_mode="disabled")
+            profiler.start()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.stop()
+                with self._lock:
+                    self._parts.append(profiler.last_session)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with self._lock:
+                self._parts.append(profiler)
+
+    def save(self, directory: str) -> str | None:
+        """
+        Write the merged profile; returns its path (None if nothing ran under the profiler).
+        """
+        with self._lock:
+            parts = list(self._parts)
+        if not parts:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}-{os.getpid()}-{random.randrange(16**6):06x}")
+        if PYINSTRUMENT_AVAILABLE:
+            from pyinstrument.renderers import HTMLRenderer
+
+            session = parts[0]
+            for part in parts[1:]:
+                session = Session.combine(session, part)
+            path = stem + ".html"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(HTMLRenderer().render(session))
+            return path
+        stats = pstats.Stats(parts[0])
+        for part in parts[1:]:
+            stats.add(part)
+        path = stem + ".prof"
+        stats.dump_stats(path)
+        return path
+
+
+class ProfileGate:
+    def __init__(self, token: str = "", sample_rate: float = 0.0, max_per_minute: int = 6):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.max_per_minute = max_per_minute
+        self._recent = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    def authorized(self, token: str | None) -> bool:
+        return bool(self.token) and bool(token) and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def _allow(self) -> bool:
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 60.0:
+            self._recent.popleft()
+        if len(self._recent) >= self.max_per_minute:
+            return False
+        self._recent.append(now)
+        return True
+
+    def start(self, token: str | None, name: str):
+        """
+        Returns (RequestProfile, contextvar token) when this request should be profiled,
+        else (None, None). Pass the result to finish().
+        """
+        if not self.token:
+            return None, None
+        requested = token is not None and self.authorized(token)
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not (requested or sampled) or not self._allow():
+            return None, None
+        profile = RequestProfile(name)
+        return profile, _current.set(profile)
+
+    def finish(self, started) -> RequestProfile | None:
+        """
+        Stop profiling the current request (same context as start()); returns the
+        RequestProfile to save(), if any.
+        """
+        profile, ctx_token = started
+        if profile is not None:
+            _current.reset(ctx_token)
+        return profile
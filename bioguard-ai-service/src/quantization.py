@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+INT8 post-training quantization for MiniFASNetV1SE.
+
+    python -m src.quantization models/4_0_0_80x80_MiniFASNetV1SE.pth --mode static --calib-dir crops/
+    python -m src.quantization models/4_0_0_80x80_MiniFASNetV1SE.pth --mode dynamic
+
+Modes:
+- dynamic: Linear layers quantized dynamically (weights int8, activations quantized per call).
+- static:  conv blocks + Linear quantized with activation ranges calibrated over a folder
+           of crops produced by CropImage. PReLU and depthwise convs stay in fp32: the native
+           quantized PReLU kernel loses accuracy on this network and quantized depthwise convs
+           are slower than fp32 on x86.
+
+The quantized model is saved as frozen TorchScript next to the .pth
+(e.g. 4_0_0_80x80_MiniFASNetV1SE.int8-static.pt) and loaded by the
+"torch-int8-static" / "torch-int8-dynamic" backends in src/backends.py.
+A report compares latency, serialized model size, process memory (RSS after loading the
+model and one forward, each in a fresh process) and probability drift against fp32.
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.nn import Conv2d, Linear, Module, PReLU
+
+from src.anti_spoof_predict import AntiSpoofPredict
+from src.utility import load_crops, parse_model_name
+
+QUANT_MODES = ("dynamic", "static")
+
+
+def quantized_model_path(pth_path: str, mode: str) -> str:
+    return os.path.splitext(pth_path)[0] + f".int8-{mode}.pt"
+
+
+class _FloatPReLU(Module):
+    """PReLU kept in fp32 (registered as non-traceable, so FX quantization leaves it alone)."""
+
+    def __init__(self, prelu: PReLU):
+        super().__init__()
+        self.weight = prelu.weight
+
+    def forward(self, x):
+        return F.prelu(x, self.weight)
+
+
+def _swap_prelu(module: Module):
+    for name, child in module.named_children():
+        if isinstance(child, PReLU):
+            setattr(module, name, _FloatPReLU(child))
+        else:
+            _swap_prelu(child)
+
+
+def _to_batch(crops: list[np.ndarray]) -> torch.Tensor:
+    return torch.from_numpy(np.ascontiguousarray(np.stack(crops).transpose((0, 3, 1, 2)))).float()
+
+
+def quantize_dynamic(model: Module) -> Module:
+    from torch.ao.quantization import quantize_dynamic as _quantize_dynamic
+
+    return _quantize_dynamic(copy.deepcopy(model), {Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model: Module, calib_crops: list[np.ndarray], batch_size: int = 16) -> Module:
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.fx.custom_config import PrepareCustomConfig
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+    torch.backends.quantized.engine = engine
+
+    model = copy.deepcopy(model).eval()
+    qconfig_mapping = get_default_qconfig_mapping(engine)
+    for name, module in model.named_modules():
+        if isinstance(module, Conv2d) and module.groups > 1:
+            qconfig_mapping.set_module_name(name, None)
+    _swap_prelu(model)
+    prepare_config = PrepareCustomConfig().set_non_traceable_module_classes([_FloatPReLU])
+
+    example = _to_batch(calib_crops[:1])
+    prepared = prepare_fx(model, qconfig_mapping, (example,), prepare_custom_config=prepare_config)
+    with torch.no_grad():
+        for i in range(0, len(calib_crops), batch_size):
+            prepared(_to_batch(calib_crops[i : i + batch_size]))
+    return convert_fx(prepared)
+
+
+def save_quantized(model: Module, path: str, example: torch.Tensor) -> str:
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(model, example).eval())
+    torch.jit.save(scripted, path)
+    return path
+
+
+def _serialized_size(model) -> int:
+    buf = io.BytesIO()
+    if isinstance(model, torch.jit.ScriptModule):
+        torch.jit.save(model, buf)
+    else:
+        torch.save(model.state_dict(), buf)
+    return buf.tell()
+
+
+def _rss_bytes() -> int:
+    """
+    Current resident set size of this process (Linux /proc; peak RSS elsewhere).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _rss_after_forward(model_path: str, batch_size: int) -> dict:
+    """
+    Runs in a fresh process: RSS after loading model_path (.pth as fp32, else quantized
+    TorchScript) and running one forward; model_rss_bytes is the growth over torch alone.
+    """
+    h_input, w_input, _model_type, _ = parse_model_name(os.path.basename(model_path))
+    before = _rss_bytes()
+    if model_path.endswith(".pth"):
+        predictor = AntiSpoofPredict(device_id=0)
+        predictor.device = torch.device("cpu")
+        predictor.load_model(model_path)
+        model = predictor.model
+    else:
+        model = torch.jit.load(model_path)
+    with torch.no_grad():
+        model(torch.rand(batch_size, 3, h_input, w_input) * 255)
+    after = _rss_bytes()
+    return {"rss_bytes": after, "model_rss_bytes": after - before}
+
+
+def memory_footprint(fp32_path: str, int8_path: str, batch_size: int = 8) -> dict:
+    """
+    Process memory of the fp32 and the int8 model, each measured in its own spawned process.
+    """
+    footprint = {}
+    for name, path in (("fp32", fp32_path), ("int8", int8_path)):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            footprint[name] = pool.submit(_rss_after_forward, path, batch_size).result()
+    footprint["batch_size"] = batch_size
+    return footprint
+
+
+def _latency_ms(model, batch: torch.Tensor, repeat: int = 20) -> float:
+    with torch.no_grad():
+        for _ in range(3):
+            model(batch)
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            model(batch)
+    return (time.perf_counter() - t0) * 1000.0 / repeat
+
+
+def compare(fp32_model, int8_model, eval_crops: list[np.ndarray], batch_sizes=(1, 8)) -> dict:
+    """
+    Latency per batch size, serialized model size and probability drift of int8 vs fp32.
+    """
+    batch = _to_batch(eval_crops)
+    with torch.no_grad():
+        ref = F.softmax(fp32_model(batch), dim=1).numpy()
+        out = F.softmax(int8_model(batch), dim=1).numpy()
+    diff = np.abs(ref - out)
+
+    latency = {}
+    for bs in batch_sizes:
+        b = _to_batch([eval_crops[i % len(eval_crops)] for i in range(bs)])
+        latency[f"batch_{bs}"] = {"fp32_ms": _latency_ms(fp32_model, b), "int8_ms": _latency_ms(int8_model, b)}
+
+    return {
+        "crops": len(eval_crops),
+        "latency": latency,
+        "model_size_bytes": {"fp32": _serialized_size(fp32_model), "int8": _serialized_size(int8_model)},
+        "drift": {
+            "max_abs": float(diff.max()),
+            "mean_abs": float(diff.mean()),
+            "max_abs_real": float(diff[:, 1].max()),
+            "label_agreement": float(np.mean(np.argmax(ref, axis=1) == np.argmax(out, axis=1))),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="INT8 quantization for MiniFASNetV1SE")
+    parser.add_argument("pth_path")
+    parser.add_argument("--mode", choices=QUANT_MODES, default="static")
+    parser.add_argument("--calib-dir", help="folder of CropImage crops used for calibration and the drift report")
+    parser.add_argument("--calib-count", type=int, default=256)
+    parser.add_argument("--report", help="write the comparison report to this JSON file")
+    args = parser.parse_args(argv)
+    if args.mode == "static" and not args.calib_dir:
+        parser.error("--mode static needs --calib-dir: activation ranges calibrated on random crops give a broken model")
+
+    h_input, w_input, _model_type, _ = parse_model_name(os.path.basename(args.pth_path))
+    predictor = AntiSpoofPredict(device_id=0)
+    predictor.device = torch.device("cpu")
+    predictor.load_model(args.pth_path)
+    fp32_model = predictor.model
+
+    crops = load_crops(args.calib_dir, (h_input, w_input), count=args.calib_count, fallback=args.mode != "static")
+    if not crops:
+        parser.error(f"no readable images in --calib-dir {args.calib_dir}")
+    if not args.calib_dir:
+        print("Warning: no --calib-dir given, drift is measured on random crops (not meaningful).")
+    # Hold out a quarter of the crops for the drift report.
+    split = max(1, len(crops) * 3 // 4) if len(crops) > 1 else 1
+    calib_crops, eval_crops = crops[:split], (crops[split:] or crops)
+
+    if args.mode == "dynamic":
+        int8_model = quantize_dynamic(fp32_model)
+    else:
+        int8_model = quantize_static(fp32_model, calib_crops)
+
+    out_path = save_quantized(int8_model, quantized_model_path(args.pth_path, args.mode), _to_batch(eval_crops[:1]))
+    print(f"Saved: {out_path}")
+
+    report = compare(fp32_model, torch.jit.load(out_path), eval_crops)
+    report["memory"] = memory_footprint(args.pth_path, out_path)
+    report["mode"] = args.mode
+    report["model"] = os.path.basename(out_path)
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
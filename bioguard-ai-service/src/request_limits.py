@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Reject oversized request bodies before they are buffered.
+
+A plain ASGI middleware (no BaseHTTPMiddleware, so streaming is untouched):
+- a declared Content-Length above max_bytes gets 413 without reading the body
+- bodies without Content-Length (chunked) are counted as they stream in, and
+  RequestTooLargeError (413) is raised as soon as the limit is crossed
+"""
+
+from __future__ import annotations
+
+import json
+
+from starlette.exceptions import HTTPException
+
+
+class RequestTooLargeError(HTTPException):
+    """Request body exceeds the configured limit (413; passes through FastAPI's body parsing)."""
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=413, detail=detail)
+
+
+class MaxBodySizeMiddleware:
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = None
+        for key, value in scope.get("headers", ()):
+            if key == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    content_length = None
+                break
+
+        if content_length is not None:
+            if content_length > self.max_bytes:
+                await self._reject(send)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        received = 0
+        max_bytes = self.max_bytes
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise RequestTooLargeError(f"Request body too large (> {max_bytes} bytes)")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Request body too large (max {self.max_bytes} bytes)"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed result cache with in-flight request coalescing.
+
+Keys are blake2b digests of the encoded image bytes plus the model version (and
+the request variant, e.g. multi-face mode), so a retried upload of the same frame
+returns the stored result, and a model change (set_version) invalidates everything. Entries expire after ttl_s and the cache
+holds at most max_entries (LRU eviction).
+
+Concurrent requests for the same key share one computation: the first caller
+runs it, the others await its result. Failures are not cached. If the first
+caller is cancelled (e.g. its client disconnected), a waiting caller takes over
+the computation instead of being cancelled along with it.
+
+Used from the event loop only (no locking needed); key() only hashes and can run on a
+worker thread, its result passed to get_or_compute(key=...).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class _LeaderCancelled(Exception):
+    """The request computing an in-flight key was cancelled."""
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 30.0, version: str = ""):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.version = version
+        self._entries: OrderedDict[bytes, tuple[float, object]] = OrderedDict()
+        self._inflight: dict[bytes, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, payload, variant: str = "") -> bytes:
+        digest = hashlib.blake2b(payload, digest_size=16)
+        digest.update(self.version.encode())
+        if variant:
+            digest.update(b"\0" + variant.encode())
+        return digest.digest()
+
+    def set_version(self, version: str) -> None:
+        """
+        Switch to a new model version; drops every cached result.
+        """
+        if version != self.version:
+            self.version = version
+            self.clear()
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get(self, key: bytes):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: bytes, value) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, payload, compute, variant: str = "", key: bytes | None = None):
+        """
+        payload: encoded image bytes; compute: zero-argument coroutine function;
+        variant: requests whose response differs for the same image get their own entries.
+        key: self.key(payload, variant) if already computed (e.g. off the event loop).
+        Returns (value, status) with status "hit", "coalesced" or "miss".
+        """
+        if key is None:
+            key = self.key(payload, variant)
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value, "hit"
+
+        while (pending := self._inflight.get(key)) is not None:
+            try:
+                value = await asyncio.shield(pending)
+            except _LeaderCancelled:
+                continue  # the first waiter to resume becomes the new leader, the others wait for it
+            self.coalesced += 1
+            return value, "coalesced"
+
+        self.misses += 1
+        version = self.version
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        if version == self.version:
+            self.put(key, value)
+        return value, "miss"
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "version": self.version,
+        }
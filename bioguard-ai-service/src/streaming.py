@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Per-connection state for streaming liveness (WebSocket).
+
+- LatestFrameSlot: holds only the newest frame; a frame that arrives while the
+  previous one is still waiting replaces it (counted as dropped), so a client
+  sending faster than we infer never builds up a backlog.
+- StreamSession: last bbox (fallback when a frame has no detectable face) and a
+  rolling window of per-frame probabilities; verdict() returns a decision as
+  soon as the window is confident either way, or when max_frames is reached.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+
+
+class LatestFrameSlot:
+    def __init__(self):
+        self._frame = None
+        self._event = asyncio.Event()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, frame) -> None:
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self._event.set()
+
+    def close(self) -> None:
+        self._closed = True
+        self._event.set()
+
+    async def get(self):
+        """
+        Next (newest) frame, or None once the slot is closed and empty.
+        """
+        while self._frame is None:
+            if self._closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class StreamSession:
+    def __init__(self, window: int = 5, min_frames: int = 3, max_frames: int = 30,
+                 real_threshold: float = 0.8, fake_threshold: float = 0.8):
+        self.window = deque(maxlen=max(1, window))
+        self.min_frames = max(1, min(min_frames, self.window.maxlen))
+        self.max_frames = max_frames
+        self.real_threshold = real_threshold
+        self.fake_threshold = fake_threshold
+        self.last_bbox = None  # original image coordinates
+        self.frames_received = 0
+        self.frames_inferred = 0
+
+    def add(self, probabilities: dict, bbox=None) -> None:
+        """
+        probabilities: {"real", "fake", "unknown"} of one frame; bbox: its detected face, if any.
+        """
+        self.window.append((float(probabilities["real"]), float(probabilities["fake"])))
+        self.frames_inferred += 1
+        if bbox is not None:
+            self.last_bbox = list(bbox)
+
+    def window_probabilities(self) -> dict:
+        if not self.window:
+            return {"real": 0.0, "fake": 0.0}
+        n = len(self.window)
+        return {
+            "real": sum(real for real, _fake in self.window) / n,
+            "fake": sum(fake for _real, fake in self.window) / n,
+        }
+
+    def verdict(self) -> dict | None:
+        """
+        {"is_real", "confidence", "reason"} once decided, else None.
+        """
+        probs = self.window_probabilities()
+        if len(self.window) >= self.min_frames:
+            if probs["real"] >= self.real_threshold:
+                return {"is_real": True, "confidence": probs["real"], "reason": "confident_real"}
+            if probs["fake"] >= self.fake_threshold:
+                return {"is_real": False, "confidence": probs["real"], "reason": "confident_spoof"}
+        if self.max_frames and self.frames_inferred >= self.max_frames:
+            return {"is_real": False, "confidence": probs["real"], "reason": "max_frames"}
+        return None
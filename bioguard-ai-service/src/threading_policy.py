@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+CPU threading policy for torch, OpenCV and onnxruntime.
+
+Left alone, each library sizes its thread pool to every core of the host, not to the
+cgroup CPU quota a container actually gets, and every server worker (and every
+concurrent request inside one: torch and OpenCV start a thread team per calling thread)
+does the same. The result is many more runnable threads than CPUs, CFS throttling under
+a quota, and bad tail latency.
+
+ThreadPolicy derives the thread counts from the CPUs the process may use (affinity mask,
+capped by the cgroup v2 / v1 CPU quota):
+
+    cpus_per_worker = cpus // workers
+    threads         = cpus_per_worker // concurrent requests per worker (INFERENCE_WORKERS)
+
+used for torch intra-op, OpenCV and onnxruntime intra-op threads; torch inter-op threads
+are 1 (model concurrency comes from the ensemble's own thread pool). Every value can be
+overridden: CPU_LIMIT, TORCH_NUM_THREADS, TORCH_INTEROP_THREADS, CV2_NUM_THREADS,
+ORT_NUM_THREADS. With CPU_AFFINITY=1, pin() restricts a worker to its own slice of CPUs
+so workers don't migrate across (and share) cores.
+
+configure() builds the policy from the environment, applies it and makes it current():
+main.py calls current() at import (configuring once), gunicorn.conf.py calls configure()
+again in every worker after fork. Importing this module does not import torch; apply()
+configures the libraries that are loaded and can be called again once more of them are.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def _read(path: str) -> str | None:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota() -> float | None:
+    """
+    CPU quota of this process's cgroup in CPUs (e.g. 2.5), or None when unlimited / unknown.
+    """
+    # cgroup v2: "<quota> <period>" or "max <period>"; the tightest limit on the path to the root applies.
+    own = ""
+    for line in (_read("/proc/self/cgroup") or "").splitlines():
+        if line.startswith("0::"):
+            own = line[3:].strip("/")
+    limits = []
+    parts = own.split("/") if own else []
+    for depth in range(len(parts), -1, -1):
+        value = _read(os.path.join(CGROUP_ROOT, *parts[:depth], "cpu.max"))
+        if value:
+            quota, _, period = value.partition(" ")
+            if quota != "max":
+                limits.append(int(quota) / int(period or 100000))
+    if limits:
+        return min(limits)
+    # cgroup v1
+    quota = _read(os.path.join(CGROUP_ROOT, "cpu", "cpu.cfs_quota_us"))
+    period = _read(os.path.join(CGROUP_ROOT, "cpu", "cpu.cfs_period_us"))
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> list[int]:
+    """
+    CPU ids this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name, "").strip()
+    return int(value) if value else default
+
+
+class ThreadPolicy:
+    def __init__(self, workers: int = 1, concurrency: int = 1, cpu_limit: int | None = None, pin: bool = False):
+        """
+        workers: server processes sharing the CPUs; concurrency: requests one worker runs at once.
+        cpu_limit: CPUs to plan for (default: affinity mask capped by the cgroup quota).
+        """
+        self.cpu_ids = available_cpus()
+        self.quota = cgroup_cpu_quota()
+        if cpu_limit is None:
+            cpu_limit = len(self.cpu_ids)
+            if self.quota is not None:
+                cpu_limit = min(cpu_limit, max(1, int(self.quota)))
+        self.cpus = max(1, cpu_limit)
+        self.workers = max(1, workers)
+        self.concurrency = max(1, concurrency)
+        self.pin_workers = pin
+        self.cpus_per_worker = max(1, self.cpus // self.workers)
+        threads = max(1, self.cpus_per_worker // self.concurrency)
+        self.torch_threads = _env_int("TORCH_NUM_THREADS", threads)
+        self.torch_interop_threads = _env_int("TORCH_INTEROP_THREADS", 1)
+        self.cv2_threads = _env_int("CV2_NUM_THREADS", threads)
+        self.ort_threads = _env_int("ORT_NUM_THREADS", threads)
+        self.pinned = None
+
+    @classmethod
+    def from_env(cls, workers: int | None = None) -> "ThreadPolicy":
+        """
+        workers defaults to WEB_CONCURRENCY, concurrency to INFERENCE_WORKERS (as in main.py).
+        """
+        if workers is None:
+            workers = _env_int("WEB_CONCURRENCY", 1)
+        cpu_limit = os.getenv("CPU_LIMIT", "").strip()
+        return cls(
+            workers=workers,
+            concurrency=_env_int("INFERENCE_WORKERS", 2),
+            cpu_limit=int(cpu_limit) if cpu_limit else None,
+            pin=os.getenv("CPU_AFFINITY", "0") == "1",
+        )
+
+    def apply(self) -> None:
+        """
+        Set the thread counts of OpenCV and of torch / onnxruntime if they are imported.
+        """
+        import cv2
+
+        cv2.setNumThreads(self.cv2_threads)
+        torch = sys.modules.get("torch")
+        if torch is not None:
+            torch.set_num_threads(self.torch_threads)
+            try:
+                torch.set_num_interop_threads(self.torch_interop_threads)
+            except RuntimeError:
+                pass  # only settable once, before inter-op work started (e.g. already set before fork)
+        backends = sys.modules.get("src.backends")
+        if backends is not None:
+            backends.OnnxAntiSpoofPredict.intra_op_threads = self.ort_threads
+
+    def worker_cpus(self, slot: int) -> list[int]:
+        """
+        The CPUs of worker `slot` (0 .. workers-1): disjoint slices of the usable CPUs, one CPU
+        per worker round-robin when there are more workers than CPUs.
+        """
+        cpu_ids = self.cpu_ids[: self.cpus]
+        if self.workers > len(cpu_ids):
+            return [cpu_ids[slot % len(cpu_ids)]]
+        per_worker = len(cpu_ids) // self.workers
+        return cpu_ids[slot * per_worker : (slot + 1) * per_worker]
+
+    def pin(self, slot: int) -> list[int] | None:
+        """
+        Restrict this process to worker `slot`'s CPUs (when CPU_AFFINITY is on and supported).
+        """
+        if not self.pin_workers or not hasattr(os, "sched_setaffinity"):
+            return None
+        cpus = self.worker_cpus(slot)
+        os.sched_setaffinity(0, cpus)
+        self.pinned = cpus
+        return cpus
+
+    def info(self) -> dict:
+        return {
+            "cpus": self.cpus,
+            "cgroup_quota": self.quota,
+            "affinity": len(self.cpu_ids),
+            "workers": self.workers,
+            "concurrency": self.concurrency,
+            "torch_threads": self.torch_threads,
+            "torch_interop_threads": self.torch_interop_threads,
+            "cv2_threads": self.cv2_threads,
+            "ort_threads": self.ort_threads,
+            "pinned": self.pinned,
+        }
+
+
+_current: ThreadPolicy | None = None
+
+
+def configure(workers: int | None = None, slot: int | None = None) -> ThreadPolicy:
+    """
+    Build the policy from the environment, pin this process to worker `slot`'s CPUs
+    (CPU_AFFINITY=1), apply it and make it the current one.
+    """
+    global _current
+    policy = ThreadPolicy.from_env(workers)
+    if slot is not None:
+        policy.pin(slot)
+    policy.apply()
+    _current = policy
+    return policy
+
+
+def current() -> ThreadPolicy:
+    """
+    The configured policy (configured from the environment on first use).
+    """
+    return _current if _current is not None else configure()
@@ -3,6 +3,9 @@ from __future__ import annotations
 from datetime import datetime
 import os
 
+import cv2
+import numpy as np
+
 
 def get_time() -> str:
     return (str(datetime.now())[:-10]).replace(" ", "-").replace(":", "-")
@@ -15,12 +18,12 @@ def get_kernel(height: int, width: int):
 
 def parse_model_name(model_name: str):
     """
-    Parses names like: 4_0_0_80x80_MiniFASNetV1SE.pth
+    Parses names like: 4_0_0_80x80_MiniFASNetV1SE.pth (or exported variants such as .onnx)
     Returns: (h_input, w_input, model_type, scale)
     """
     info = model_name.split("_")[0:-1]
     h_input, w_input = info[-1].split("x")
-    model_type = model_name.split(".pth")[0].split("_")[-1]
+    model_type = model_name.split("_")[-1].split(".")[0]
     if info[0] == "org":
         scale = None
     else:
@@ -28,8 +31,39 @@ def parse_model_name(model_name: str):
     return int(h_input), int(w_input), model_type, scale
 
 
+def center_square_bbox(image: np.ndarray):
+    """
+    Centered square [x, y, w, h] with the image's shorter side: the crop used when no face is found.
+    """
+    h, w = image.shape[:2]
+    size = min(w, h)
+    return [int(w // 2 - size // 2), int(h // 2 - size // 2), int(size), int(size)]
+
+
 def make_if_not_exist(folder_path: str):
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
 
+def load_crops(crops_dir: str | None, size: tuple[int, int], count: int = 32, seed: int = 0,
+               fallback: bool = True) -> list[np.ndarray]:
+    """
+    Crops from a folder (e.g. CropImage output), resized to `size` = (h, w).
+    Falls back to random BGR crops when no folder (or no readable image) is given,
+    or returns [] with fallback=False.
+    """
+    h, w = size
+    if crops_dir:
+        crops = []
+        for name in sorted(os.listdir(crops_dir)):
+            img = cv2.imread(os.path.join(crops_dir, name), cv2.IMREAD_COLOR)
+            if img is not None:
+                crops.append(cv2.resize(img, (w, h)))
+            if len(crops) >= count:
+                break
+        if crops:
+            return crops
+    if not fallback:
+        return []
+    rng = np.random.RandomState(seed)
+    return [rng.randint(0, 256, (h, w, 3), dtype=np.uint8) for _ in range(count)]
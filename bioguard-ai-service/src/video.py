@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Short-clip input: frame sampling and face tracking.
+
+- sample_frames() decodes an uploaded clip (MP4 / WebM / anything the OpenCV FFmpeg
+  backend reads) and returns frames at about sample_fps, by presentation time, so
+  variable frame rate phone recordings are sampled evenly. Frames in between are only
+  grabbed (decoded, not converted to BGR). Sampled frames are downscaled to max_side right
+  away, so a 4K clip holds max_frames small frames, not max_frames 4K ones.
+- FaceTracker follows one face across the sampled frames: it looks for the face in a
+  window around its previous position first (much cheaper than a full-frame cascade
+  pass) and only falls back to the whole frame when it is not found there. Among several
+  faces it keeps the one overlapping the previous box most, so a bystander does not take
+  over; frames without a detection reuse the last box.
+"""
+
+from __future__ import annotations
+
+import tempfile
+
+import cv2
+import numpy as np
+
+from src.image_io import ImageTooLargeError
+
+
+class VideoError(ValueError):
+    """The upload is not a decodable video."""
+
+
+def sample_frames(data, sample_fps: float = 5.0, max_frames: int = 20, max_duration_s: float = 10.0,
+                  max_pixels: int = 0, tmp_dir: str | None = None, max_side: int = 0):
+    """
+    data: encoded clip bytes. OpenCV reads videos from files only, so the bytes go to a
+    temporary file in tmp_dir (e.g. /dev/shm to stay in memory).
+    max_side: sampled frames with a longer side are downscaled to it (0 = keep full size).
+    Returns (frames, info): frames is a list of (frame index, time ms, BGR image); info has
+    fps, frame_count, width, height, scale (multiply frame coordinates by it to get video
+    coordinates) and truncated (stopped at max_frames / max_duration_s).
+    Raises VideoError if nothing can be decoded, ImageTooLargeError above max_pixels per frame.
+    """
+    with tempfile.NamedTemporaryFile(dir=tmp_dir, suffix=".video") as f:
+        f.write(data)
+        f.flush()
+        cap = cv2.VideoCapture(f.name, cv2.CAP_FFMPEG)
+        try:
+            if not cap.isOpened():
+                raise VideoError("Invalid video data")
+            return _sample(cap, sample_fps, max_frames, max_duration_s, max_pixels, max_side)
+        finally:
+            cap.release()
+
+
+def _check_pixels(width: int, height: int, max_pixels: int) -> None:
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLargeError(f"Video frames too large ({width}x{height} > {max_pixels} pixels)")
+
+
+def _sample(cap, sample_fps: float, max_frames: int, max_duration_s: float, max_pixels: int, max_side: int):
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    if not 0.0 < fps < 1000.0:
+        fps = 30.0  # unknown / bogus container rate; only used when frames carry no timestamps
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    _check_pixels(width, height, max_pixels)  # container header; decoded frames are checked too
+
+    interval_ms = 1000.0 / sample_fps if sample_fps > 0 else 0.0
+    frames = []
+    index = -1
+    next_ms = 0.0
+    truncated = False
+    scale = 1.0
+    while cap.grab():
+        index += 1
+        time_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+        if time_ms <= 0.0 and index > 0:
+            time_ms = index * 1000.0 / fps
+        if max_duration_s and time_ms > max_duration_s * 1000.0:
+            truncated = True
+            break
+        if time_ms + 1e-3 < next_ms:
+            continue
+        ok, frame = cap.retrieve()
+        if not ok:
+            continue
+        h, w = frame.shape[:2]
+        _check_pixels(w, h, max_pixels)
+        if max_side and max(h, w) > max_side:
+            scale = max(h, w) / float(max_side)
+            frame = cv2.resize(frame, (max(1, round(w / scale)), max(1, round(h / scale))), interpolation=cv2.INTER_AREA)
+        frames.append((index, round(time_ms, 1), frame))
+        next_ms = time_ms + interval_ms
+        if len(frames) >= max_frames:
+            truncated = cap.grab()
+            break
+    if not frames:
+        raise VideoError("No decodable frames in video")
+    info = {
+        "fps": round(fps, 3),
+        "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "width": width,
+        "height": height,
+        "scale": round(scale, 4),
+        "truncated": truncated,
+    }
+    return frames, info
+
+
+def iou(a, b) -> float:
+    ax1, ay1, bx1, by1 = a[0] + a[2], a[1] + a[3], b[0] + b[2], b[1] + b[3]
+    iw = min(ax1, bx1) - max(a[0], b[0])
+    ih = min(ay1, by1) - max(a[1], b[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(a[2] * a[3] + b[2] * b[3] - inter)
+
+
+class FaceTracker:
+    def __init__(self, detector, search_scale: float = 2.0, min_iou: float = 0.2, min_size: int | None = None):
+        """
+        detector: Detection (get_bboxes). search_scale: size of the search window around the
+        previous box, relative to the box. min_iou: below this overlap a detection found in the
+        full frame counts as a different face (the largest one is then taken).
+        min_size: smallest face in frame pixels (None = the detector's min_face_size).
+        """
+        self.detector = detector
+        self.min_size = min_size
+        self.search_scale = search_scale
+        self.min_iou = min_iou
+        self.bbox = None
+        self.window_hits = 0
+        self.full_scans = 0
+
+    def _search_window(self, frame: np.ndarray):
+        h, w = frame.shape[:2]
+        x, y, bw, bh = self.bbox
+        cx, cy = x + bw / 2.0, y + bh / 2.0
+        half_w, half_h = bw * self.search_scale / 2.0, bh * self.search_scale / 2.0
+        x0, y0 = max(0, int(cx - half_w)), max(0, int(cy - half_h))
+        x1, y1 = min(w, int(cx + half_w)), min(h, int(cy + half_h))
+        return x0, y0, x1, y1
+
+    def update(self, frame: np.ndarray):
+        """
+        Returns (bbox [x, y, w, h] or None if no face was ever found, face found in this frame).
+        """
+        if self.bbox is not None:
+            x0, y0, x1, y1 = self._search_window(frame)
+            faces = [[fx + x0, fy + y0, fw, fh] for fx, fy, fw, fh in self.detector.get_bboxes(frame[y0:y1, x0:x1], self.min_size)]
+            if faces:
+                self.window_hits += 1
+                self.bbox = max(faces, key=lambda f: iou(f, self.bbox))
+                return self.bbox, True
+
+        self.full_scans += 1
+        faces = self.detector.get_bboxes(frame, self.min_size)
+        if not faces:
+            return self.bbox, False
+        if self.bbox is not None:
+            best = max(faces, key=lambda f: iou(f, self.bbox))
+            if iou(best, self.bbox) >= self.min_iou:
+                self.bbox = best
+                return self.bbox, True
+        self.bbox = faces[0]  # largest
+        return self.bbox, True
@@ -0,0 +1,72 @@
+"""
+PyTorch and ONNX Runtime backends return the same probabilities on the same crops.
+
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+pytest.importorskip("onnxruntime")
+torch = pytest.importorskip("torch")
+
+from src.anti_spoof_predict import AntiSpoofPredict
+from src.backends import OnnxAntiSpoofPredict
+from src.export_onnx import export_onnx
+from src.generate_patches import CropImage
+
+MODEL_NAME = "4_0_0_80x80_MiniFASNetV1SE"
+PTH_PATH = os.path.join(SERVICE_DIR, "models", MODEL_NAME + ".pth")
+ATOL = 1e-4
+
+
+@pytest.fixture(scope="module")
+def predictors(tmp_path_factory):
+    if not os.path.exists(PTH_PATH):
+        pytest.skip(f"{PTH_PATH} not found")
+    onnx_path = export_onnx(PTH_PATH, str(tmp_path_factory.mktemp("onnx") / (MODEL_NAME + ".onnx")))
+
+    torch_predictor = AntiSpoofPredict(device_id=0)
+    torch_predictor.device = torch.device("cpu")
+    torch_predictor.load_model(PTH_PATH)
+    onnx_predictor = OnnxAntiSpoofPredict(device_id=0)
+    onnx_predictor.load_model(onnx_path)
+    return torch_predictor, onnx_predictor
+
+
+@pytest.fixture(scope="module")
+def crops():
+    """80x80 crops cut by CropImage from smooth and noisy synthetic frames."""
+    rng = np.random.RandomState(0)
+    ramp = np.linspace(0, 255, 640, dtype=np.float32)
+    frames = [
+        np.dstack([np.tile(ramp, (480, 1)), np.tile(ramp[:480, None], (1, 640)), np.full((480, 640), 128.0)]).astype(np.uint8),
+        rng.randint(0, 256, (480, 640, 3), dtype=np.uint8),
+    ]
+    cropper = CropImage()
+    out = []
+    for frame in frames:
+        for bbox in ([200, 120, 200, 200], [60, 40, 150, 180], [400, 250, 120, 120], [0, 0, 640, 480]):
+            out.append(cropper.crop(frame, bbox, 4.0, 80, 80, True))
+    return out
+
+
+def test_batch_of_one(predictors, crops):
+    torch_predictor, onnx_predictor = predictors
+    for crop in crops:
+        np.testing.assert_allclose(onnx_predictor.predict_batch([crop]), torch_predictor.predict_batch([crop]), atol=ATOL)
+
+
+def test_batch_of_n(predictors, crops):
+    torch_predictor, onnx_predictor = predictors
+    torch_probs = torch_predictor.predict_batch(crops)
+    onnx_probs = onnx_predictor.predict_batch(crops)
+    assert torch_probs.shape == onnx_probs.shape == (len(crops), 3)
+    np.testing.assert_allclose(onnx_probs, torch_probs, atol=ATOL)
+    assert np.array_equal(np.argmax(onnx_probs, axis=1), np.argmax(torch_probs, axis=1))
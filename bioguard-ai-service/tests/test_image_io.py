@@ -0,0 +1,57 @@
+"""
+decode_image() size limits: oversized headers are rejected before any pixel is decoded.
+
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.image_io import ImageTooLargeError, decode_image, read_image_size
+
+
+def _jpeg_with_header_size(width: int, height: int) -> bytes:
+    """A small valid JPEG whose SOF header claims width x height."""
+    ok, buf = cv2.imencode(".jpg", np.full((64, 64, 3), 128, np.uint8))
+    assert ok
+    data = bytearray(buf.tobytes())
+    sof = data.index(b"\xff\xc0")
+    data[sof + 5 : sof + 7] = height.to_bytes(2, "big")
+    data[sof + 7 : sof + 9] = width.to_bytes(2, "big")
+    return bytes(data)
+
+
+def test_decompression_bomb_header_is_rejected():
+    data = _jpeg_with_header_size(14000, 14000)  # above PIL's hard limit (~179M pixels)
+    with pytest.raises(ImageTooLargeError):
+        read_image_size(data)
+    with pytest.raises(ImageTooLargeError):
+        decode_image(data, max_pixels=0)
+    with pytest.raises(ImageTooLargeError):
+        decode_image(data, max_pixels=40_000_000)
+
+
+def test_header_above_max_pixels_is_rejected():
+    data = _jpeg_with_header_size(10000, 10000)  # PIL only warns here; max_pixels decides
+    assert read_image_size(data)[:2] == (10000, 10000)
+    with pytest.raises(ImageTooLargeError):
+        decode_image(data, max_pixels=40_000_000)
+
+
+def test_unreadable_header_is_not_decoded_when_max_pixels_is_set():
+    ok, buf = cv2.imencode(".jpg", np.full((64, 64, 3), 128, np.uint8))
+    data = b"\x00" * 16 + buf.tobytes()  # PIL can't identify it
+    assert read_image_size(data) is None
+    assert decode_image(data, max_pixels=40_000_000) == (None, 1)
+
+
+def test_small_image_decodes():
+    ok, buf = cv2.imencode(".jpg", np.full((64, 48, 3), 128, np.uint8))
+    img, reduction = decode_image(buf.tobytes(), max_pixels=40_000_000)
+    assert img.shape == (64, 48, 3) and reduction == 1
@@ -0,0 +1,54 @@
+"""
+ResultCache coalescing: a cancelled leading request does not cancel the requests waiting on it.
+
+    python -m pytest -q tests
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.result_cache import ResultCache
+
+
+def test_follower_survives_leader_cancellation():
+    async def scenario():
+        cache = ResultCache()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        leader = asyncio.create_task(cache.get_or_compute(b"frame", compute))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.get_or_compute(b"frame", compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        assert leader.cancelled()
+        # One follower took over the computation, the others coalesced onto it.
+        assert sorted(status for _value, status in results) == ["coalesced", "coalesced", "miss"]
+        assert all(value == "result" for value, _status in results)
+        assert len(calls) == 2
+        assert await cache.get_or_compute(b"frame", compute) == ("result", "hit")
+
+    asyncio.run(scenario())
+
+
+def test_failure_is_shared_and_not_cached():
+    async def scenario():
+        cache = ResultCache()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError("bad frame")
+
+        results = await asyncio.gather(*(cache.get_or_compute(b"frame", compute) for _ in range(2)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert len(cache) == 0
+
+    asyncio.run(scenario())